@@ -2,160 +2,1169 @@
 # for python 2.7.x   
 # A011937E Chia Wei Meng Alexander
 
-from sys import argv
+import sys
+import Queue
+import struct
+import random
+import cPickle
+import argparse
+import multiprocessing
 from os import path
+from array import array
+from itertools import izip, imap, chain
+from collections import OrderedDict
+
+TLB_CYCLES = 1 # simulated cycles of a tlb lookup
+MEMORY_CYCLES = 100 # simulated cycles of a memory reference
+DISK_CYCLES = 100000 # simulated cycles of reading or writing a page on the backing store
+
+def _unpack_array(typecode, data):
+	"returns an array of the given typecode from a packed string"
+	unpacked = array(typecode)
+	unpacked.fromstring(data)
+	return unpacked
+
+class FrameBitmap(object):
+	"""
+	bitmap of used frames packed 32 frames to a word, frame n is bit n % 32 of word n / 32.
+	also serves as the frame allocator, free frames are searched for a word at a time starting
+	from a hint below which every word is full, so allocation is amortized constant time instead
+	of a scan from frame 0. bits past the last frame are kept set so they are never allocated.
+	"""
+	WORD_BITS = 32
+	WORD_MASK = 0xffffffff
+
+	def __init__(self, frames):
+		"initialize a bitmap of the given number of frames, all free"
+		self.frames = frames
+		self.used = 0
+		self.words = array('I', [0]) * ((frames + self.WORD_BITS - 1) / self.WORD_BITS)
+		if frames % self.WORD_BITS: self.words[-1] = self.WORD_MASK & ~((1 << frames % self.WORD_BITS) - 1)
+		self._hint = 0 # index of the first word that may have a free frame
+
+	def __len__(self):
+		return self.frames
+
+	def __getitem__(self, n):
+		"returns 1 if frame n is used, 0 if it is free"
+		if not 0 <= n < self.frames: raise IndexError("frame out of range")
+		return self.words[n >> 5] >> (n & 31) & 1
+
+	def __setitem__(self, n, used):
+		"marks frame n as used or free"
+		if not 0 <= n < self.frames: raise IndexError("frame out of range")
+		word, bit = n >> 5, 1 << (n & 31)
+		if used and not self.words[word] & bit:
+			self.words[word] |= bit
+			self.used += 1
+		elif not used and self.words[word] & bit:
+			self.words[word] &= ~bit & self.WORD_MASK
+			self.used -= 1
+			self._hint = min(self._hint, word)
+
+	def count(self):
+		"returns the number of used frames"
+		return self.used
+
+	def _find_free(self):
+		"returns the first free frame, or -1 if all are used"
+		words, full = self.words, self.WORD_MASK
+		for k in xrange(self._hint, len(words)):
+			if words[k] != full:
+				self._hint = k
+				free = ~words[k] & full
+				return k * 32 + (free & -free).bit_length() - 1
+		self._hint = len(words)
+		return -1
+
+	def _find_pair(self):
+		"""
+		returns the first of the first 2 contiguous free frames, or -1 if there are none.
+		pairs are found for a whole word at once as the free bits which have a free bit above them,
+		including the lowest bit of the next word.
+		"""
+		words, full = self.words, self.WORD_MASK
+		last = len(words) - 1
+		for k in xrange(self._hint, last + 1):
+			free = ~words[k] & full
+			if free == 0: continue
+			if k < last: free |= (~words[k + 1] & 1) << 32
+			pairs = free & (free >> 1)
+			if pairs: return k * 32 + (pairs & -pairs).bit_length() - 1
+		return -1
+
+	def _find_run(self, count):
+		"returns the first of the first count contiguous free frames, or -1 if there are none"
+		words, full = self.words, self.WORD_MASK
+		start, length = -1, 0
+		for k in xrange(self._hint, len(words)):
+			word = words[k]
+			if word == full:
+				length = 0
+			elif word == 0 and length + 32 < count:
+				if length == 0: start = k * 32
+				length += 32
+			else:
+				for bit in xrange(32):
+					if word >> bit & 1:
+						length = 0
+						continue
+					if length == 0: start = k * 32 + bit
+					length += 1
+					if length == count: return start
+		return -1
+
+	def allocate(self, count=1):
+		"marks the first count contiguous free frames as used and returns the first, or -1 if there are none"
+		if self.frames - self.used < count: return -1
+		if count == 1: frame = self._find_free()
+		elif count == 2: frame = self._find_pair()
+		else: frame = self._find_run(count)
+		if frame == -1: return -1
+		for n in xrange(frame, frame + count):
+			self[n] = 1
+		return frame
+
+	def release(self, frame, count=1):
+		"marks count frames starting from frame as free"
+		for n in xrange(frame, frame + count):
+			self[n] = 0
+
+	def stats(self):
+		"""
+		returns a dictionary of fragmentation statistics, the number of used and free frames,
+		the number of runs of contiguous free frames, the longest run and the fraction of free
+		frames outside of the longest run.
+		"""
+		runs, longest, length = 0, 0, 0
+		for n in xrange(self.frames):
+			if self.words[n >> 5] >> (n & 31) & 1:
+				length = 0
+			else:
+				if length == 0: runs += 1
+				length += 1
+				longest = max(longest, length)
+		free = self.frames - self.used
+		return {"used": self.used, "free": free, "free_runs": runs, "largest_free_run": longest,
+				"fragmentation": free and 1 - float(longest) / free or 0.0}
+
+class SparseMemory(object):
+	"""
+	physical memory which only stores the frames that have been written to, as a dictionary of
+	frame number to an array of its words. words that were never written read as 0.
+	used to simulate physical memories far too large to allocate in full.
+	"""
+	def __init__(self, size, frame_size=512):
+		"initialize an empty memory of size words"
+		self.size = size
+		self.frame_size = frame_size
+		self.frames = {}
+
+	def __len__(self):
+		return self.size
+
+	def __getitem__(self, addr):
+		"returns the word at addr"
+		if not 0 <= addr < self.size: raise IndexError("physical address out of range")
+		frame = self.frames.get(addr / self.frame_size)
+		return frame is not None and frame[addr % self.frame_size] or 0
+
+	def __setitem__(self, addr, value):
+		"writes the word at addr, storing its frame on the first non zero write"
+		if not 0 <= addr < self.size: raise IndexError("physical address out of range")
+		frame = self.frames.get(addr / self.frame_size)
+		if frame is None:
+			if value == 0: return
+			frame = self.frames[addr / self.frame_size] = array('l', [0]) * self.frame_size
+		frame[addr % self.frame_size] = value
+
+	def __getstate__(self):
+		"pickles the frames as packed strings"
+		state = self.__dict__.copy()
+		state["frames"] = dict((n, frame.tostring()) for n, frame in self.frames.iteritems())
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.frames = dict((n, _unpack_array('l', frame)) for n, frame in self.frames.iteritems())
+
+class Tlb(object):
+	"""
+	translation lookaside buffer of size entries divided into sets of ways entries, a key can only be
+	held in set key % sets. a dictionary of key to its way and frame makes lookups constant time.
+	when a set is full its victim is chosen by true lru, tree pseudo lru or at random.
+	the default of 4 entries in a single set with lru is the tlb of the assignment.
+	"""
+	POLICIES = ["lru", "plru", "random"]
+
+	def __init__(self, size=4, ways=None, policy="lru", seed=0):
+		"initialize an empty tlb, ways defaults to size making it fully associative"
+		self.size = size
+		self.ways = ways or size
+		if self.ways <= 0 or self.size % self.ways: raise ValueError("tlb size must be a multiple of its associativity")
+		if policy not in self.POLICIES: raise ValueError("unknown tlb replacement policy: %s" % policy)
+		if policy == "plru" and self.ways & (self.ways - 1): raise ValueError("pseudo lru needs a power of 2 associativity")
+		self.sets = self.size / self.ways
+		self.policy = policy
+		self._depth = self.ways.bit_length() - 1
+		self._random = random.Random(seed)
+		self._touch = getattr(self, "_touch_" + policy)
+		self._victim = getattr(self, "_victim_" + policy)
+		self.hits = self.misses = self.evictions = 0
+		self.flush()
+
+	def __getstate__(self):
+		"drops the bound methods of the replacement policy, which cannot be pickled"
+		state = self.__dict__.copy()
+		del state["_touch"], state["_victim"]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._touch = getattr(self, "_touch_" + self.policy)
+		self._victim = getattr(self, "_victim_" + self.policy)
+
+	def flush(self):
+		"invalidates every entry"
+		self._entries = {} # key: (way, frame)
+		self._slots = [[None] * self.ways for x in xrange(self.sets)] # key held by each way of each set
+		self._recency = [OrderedDict() for x in xrange(self.sets)] # lru, keys of each set from least recently used
+		self._tree = [0] * self.sets # plru, bits of each set's tree pointing towards its victim
+
+	def lookup(self, key):
+		"returns the frame of key and marks it as used, or None on a miss"
+		entry = self._entries.get(key)
+		if entry is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		self._touch(key % self.sets, entry[0], key)
+		return entry[1]
+
+	def insert(self, key, frame):
+		"adds an entry for key, replacing a victim of its set if the set is full"
+		n = key % self.sets
+		entry = self._entries.get(key)
+		if entry is not None:
+			way = entry[0]
+		else:
+			slots = self._slots[n]
+			if None in slots:
+				way = slots.index(None)
+			else:
+				way = self._victim(n)
+				del self._entries[slots[way]]
+				self.evictions += 1
+			slots[way] = key
+		self._entries[key] = (way, frame)
+		self._touch(n, way, key)
+
+	def invalidate(self, key):
+		"removes the entry for key if there is one"
+		entry = self._entries.pop(key, None)
+		if entry is not None:
+			self._slots[key % self.sets][entry[0]] = None
+			self._recency[key % self.sets].pop(key, None)
+
+	def stats(self):
+		"returns a dictionary of the hit, miss and eviction counters and the hit rate"
+		lookups = self.hits + self.misses
+		return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+				"hit_rate": lookups and float(self.hits) / lookups or 0.0}
+
+	def _touch_lru(self, n, way, key):
+		"moves key to the most recently used end of its set"
+		recency = self._recency[n]
+		recency.pop(key, None)
+		recency[key] = way
+
+	def _victim_lru(self, n):
+		"returns the way of the least recently used key of set n"
+		return self._recency[n].popitem(last=False)[1]
+
+	def _touch_plru(self, n, way, key):
+		"points every node of the tree on the path to way away from it"
+		tree, node = self._tree[n], 1
+		for level in xrange(self._depth - 1, -1, -1):
+			branch = way >> level & 1
+			if branch: tree &= ~(1 << node)
+			else: tree |= 1 << node
+			node = node * 2 + branch
+		self._tree[n] = tree
+
+	def _victim_plru(self, n):
+		"returns the way the tree of set n points to"
+		tree, node, way = self._tree[n], 1, 0
+		for level in xrange(self._depth):
+			branch = tree >> node & 1
+			way = way * 2 + branch
+			node = node * 2 + branch
+		return way
+
+	def _touch_random(self, n, way, key):
+		pass
+
+	def _victim_random(self, n):
+		"returns a random way of set n"
+		return self._random.randrange(self.ways)
+
+class FifoPolicy(object):
+	"page replacement evicting the page that has been resident the longest"
+	def __init__(self, capacity=None):
+		self._pages = OrderedDict()
+
+	def __len__(self):
+		return len(self._pages)
+
+	def insert(self, key):
+		"adds a page that has been made resident"
+		self._pages[key] = True
+
+	def miss(self, key):
+		pass
+
+	def touch(self, key):
+		pass
+
+	def evict(self, incoming=None):
+		"removes and returns the page to evict"
+		return self._pages.popitem(last=False)[0]
+
+class LruPolicy(FifoPolicy):
+	"page replacement evicting the least recently used page"
+	def touch(self, key):
+		"moves a referenced page to the most recently used end"
+		if key in self._pages: self._pages[key] = self._pages.pop(key)
+
+class ClockPolicy(object):
+	"""
+	second chance page replacement, resident pages sit on a circular list with a referenced bit.
+	the hand clears referenced bits as it passes and evicts the first page it finds without one.
+	"""
+	def __init__(self, capacity=None):
+		self._keys = [] # circular list of pages, None marks a free slot
+		self._slots = {} # page: its slot
+		self._referenced = {}
+		self._free = []
+		self._hand = 0
+
+	def __len__(self):
+		return len(self._slots)
+
+	def insert(self, key):
+		"adds a page that has been made resident to a free slot"
+		if self._free:
+			n = self._free.pop()
+			self._keys[n] = key
+		else:
+			n = len(self._keys)
+			self._keys.append(key)
+		self._slots[key] = n
+		self._referenced[key] = True
+
+	def miss(self, key):
+		pass
+
+	def touch(self, key):
+		"sets the referenced bit of a page"
+		if key in self._referenced: self._referenced[key] = True
+
+	def evict(self, incoming=None):
+		"advances the hand to the first page without its referenced bit and removes it"
+		while True:
+			key = self._keys[self._hand]
+			n = self._hand
+			self._hand = (self._hand + 1) % len(self._keys)
+			if key is None: continue
+			if self._referenced[key]:
+				self._referenced[key] = False
+				continue
+			self._keys[n] = None
+			self._free.append(n)
+			del self._slots[key], self._referenced[key]
+			return key
+
+class ArcPolicy(object):
+	"""
+	adaptive replacement cache, resident pages are split between t1 for pages referenced once and t2 for
+	pages referenced again, with ghost lists b1 and b2 of pages recently evicted from each. a fault on a ghost
+	shifts the target size p of t1 towards the list it was evicted from before the victim is chosen, and the
+	lists are trimmed so that t1 and b1 hold at most capacity pages and all four lists twice capacity.
+	capacity is the number of resident pages.
+	"""
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.p = 0
+		self.t1, self.t2, self.b1, self.b2 = OrderedDict(), OrderedDict(), OrderedDict(), OrderedDict()
+		self._missed, self._ghost, self._forget = None, None, False
+
+	def __len__(self):
+		return len(self.t1) + len(self.t2)
+
+	def miss(self, key):
+		"adapts p on a fault on a ghost, or makes room in the ghost lists for a new page, before any eviction"
+		self._missed, self._ghost, self._forget = key, None, False
+		if key in self.b1:
+			self.p = min(self.capacity, self.p + max(len(self.b2) / len(self.b1), 1))
+			del self.b1[key]
+			self._ghost = self.b1
+		elif key in self.b2:
+			self.p = max(0, self.p - max(len(self.b1) / len(self.b2), 1))
+			del self.b2[key]
+			self._ghost = self.b2
+		elif len(self.t1) + len(self.b1) >= self.capacity:
+			# t1 and b1 are full, forget the lru ghost of b1, or the lru page of t1 without leaving a ghost
+			if self.b1: self.b1.popitem(last=False)
+			else: self._forget = True
+		elif len(self.t1) + len(self.t2) + len(self.b1) + len(self.b2) >= 2 * self.capacity:
+			self.b2.popitem(last=False)
+
+	def insert(self, key):
+		"adds a page that has been made resident, to t2 if it was a ghost, else to t1"
+		if key != self._missed: self.miss(key)
+		if self._ghost is None: self.t1[key] = True
+		else: self.t2[key] = True
+		self._missed, self._ghost, self._forget = None, None, False
+
+	def touch(self, key):
+		"moves a referenced page to the most recently used end of t2"
+		if key in self.t1:
+			del self.t1[key]
+			self.t2[key] = True
+		elif key in self.t2:
+			self.t2[key] = self.t2.pop(key)
+
+	def evict(self, incoming=None):
+		"removes and returns the lru page of t1 if t1 is over its target size, else of t2, leaving a ghost"
+		from_b2 = self._ghost is self.b2 and incoming == self._missed
+		if self.t1 and (len(self.t1) > self.p or (from_b2 and len(self.t1) == self.p) or not self.t2):
+			key = self.t1.popitem(last=False)[0]
+			if not self._forget: self.b1[key] = True
+			self._forget = False
+		else:
+			key = self.t2.popitem(last=False)[0]
+			self.b2[key] = True
+		return key
+
+# page replacement policies of demand paging
+REPLACEMENT_POLICIES = {"fifo": FifoPolicy, "lru": LruPolicy, "clock": ClockPolicy, "arc": ArcPolicy}
 
 class Vm:
 
-	def __init__(self, _use_tlb=False):
-		"initialize arrays representing physical memory, bitmap and tlb"
-		self.pm = [0 for x in range(524288)]
-		self.bitmap = [0 for x in range(1024)]
-		self.bitmap[0] = 1
-		self.tlb = [[x, 0, -1, -1] for x in range(4)]
+	def __init__(self, _use_tlb=False, frames=1024, sparse=False, tlb_size=4, tlb_ways=None, tlb_policy="lru", s_bits=9, p_bits=10, w_bits=9,
+				 paging=None, resident=None, tagged=False, pwc=0, huge=False, huge_tlb=4):
+		"""
+		initialize arrays representing physical memory, bitmap and tlb.
+		frames is the number of frames in physical memory, sparse memory only stores
+		frames that are in use so it can be used to simulate very large physical memories.
+		the tlb has tlb_size entries in sets of tlb_ways, fully associative by default.
+		s_bits, p_bits and w_bits are the widths of the va fields, a frame holds a page of
+		2**w_bits words, a pt 2**p_bits entries and an st 2**s_bits entries.
+		paging is the name of a replacement policy which enables demand paging, faults on pages
+		and pts on the backing store are serviced instead of returning pf. resident limits the
+		number of resident pages, otherwise pages are only evicted when memory is full.
+		every process has its own st, the st of process 0 is at address 0. tagged tlb entries
+		carry the pid of their process as an asid, otherwise the tlb is flushed on context switches.
+		pwc is the number of entries of a page walk cache of st entries, which saves the st read of
+		walks that hit it. with huge, segments created by writes are mapped by a single huge page
+		when there are enough contiguous frames, translated by a walk of only the st and cached in
+		a tlb of huge_tlb entries. huge pages are never evicted, and memory must have room for
+		one besides the st of process 0.
+		"""
+		self.s_bits, self.p_bits, self.w_bits = s_bits, p_bits, w_bits
+		self.s_mask, self.p_mask, self.w_mask = (1 << s_bits) - 1, (1 << p_bits) - 1, (1 << w_bits) - 1
+		self.sp_bits = s_bits + p_bits
+		self.sp_mask = (1 << self.sp_bits) - 1
+		self.page_size = 1 << w_bits
+		self.pt_frames = max(1, (1 << p_bits) / self.page_size)
+		self.st_frames = max(1, (1 << s_bits) / self.page_size)
+		self.huge_frames = 1 << p_bits # frames of a huge page, the size of a whole segment
+		self.huge_mask = (1 << (p_bits + w_bits)) - 1
+		if huge and frames < self.st_frames + self.huge_frames:
+			raise ValueError("huge pages of %d frames do not fit in %d frames of memory" % (self.huge_frames, frames))
+		size = frames * self.page_size
+		self.pm = sparse and SparseMemory(size, self.page_size) or array(size <= 0x7fffffff and 'i' or 'l', [0]) * size
+		self.bitmap = FrameBitmap(frames)
+		for x in range(self.st_frames):
+			self.bitmap[x] = 1
+		self.tlb = Tlb(tlb_size, tlb_ways, tlb_policy)
 		self.use_tlb = _use_tlb
+		self.tagged = tagged
+		self.pwc = pwc and Tlb(pwc) or None # page walk cache of st entries keyed like the tlb by s
+		self.huge = huge
+		self.huge_tlb = huge and Tlb(huge_tlb) or None
+		self.huge_segments = set() # st entry addresses of segments mapped by a huge page
+		self.refs = self.translated = self.walk_refs = 0 # references, successful translations and pm reads of walks
+		self.faults = self.errors = self.allocations = 0
+		self.page_ins = self.evictions = self.writebacks = 0
+		self.switches = self.flushes = 0
+		self.walk_refs_saved = 0 # st and pt reads of walks avoided by the page walk cache and huge pages
+		if paging is not None and paging not in REPLACEMENT_POLICIES: raise ValueError("unknown page replacement policy: %s" % paging)
+		self.paging = paging and REPLACEMENT_POLICIES[paging](resident or frames)
+		self.resident_limit = resident
+		self.resident = {} # resident page of a process: address of its pt entry
+		self.dirty = set() # resident pages written since they were paged in
+		self.disk_pts = {} # st entry address of a pt on the backing store: its pt values from the setup file
+		self.sts = {0: 0} # pid: address of its st
+		self._activate(0)
+
+	def __getstate__(self):
+		"pickles an array pm as its typecode and packed string, which is far smaller and faster than a list"
+		state = self.__dict__.copy()
+		if isinstance(self.pm, array): state["pm"] = (self.pm.typecode, self.pm.tostring())
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		if isinstance(self.pm, tuple): self.pm = _unpack_array(*self.pm)
+
+	def _activate(self, pid):
+		"""
+		makes pid the running process, allocating an st for a new process. returns False if there
+		is no memory for its st. pages are keyed by the pid above their sp, and so are tlb entries when tagged.
+		"""
+		if pid not in self.sts:
+			st = self._allocate_frames(self.st_frames)
+			if st is None: return False
+			self.sts[pid] = st * self.page_size
+		self.pid = pid
+		self.st = self.sts[pid]
+		self._space = pid << self.sp_bits
+		self._tag = self.tagged and self._space or 0
+		return True
+
+	def switch(self, pid):
+		"context switches to process pid, flushing the tlb unless it is tagged, and returns the result of the event"
+		if pid == self.pid: return (pid, "s")
+		if not self._activate(pid): return self._fail("err") # out of memory for its st
+		self.switches += 1
+		if not self.tagged:
+			self.tlb.flush()
+			if self.pwc is not None: self.pwc.flush()
+			if self.huge_tlb is not None: self.huge_tlb.flush()
+			self.flushes += 1
+		return (pid, "s")
+
+	def setup(self, processes):
+		"""
+		initializes the st and pt values of a list of processes, which are the pairs of st values and
+		pt values of the setup file. the frames of every process are reserved first so that the sts of
+		processes other than process 0 are allocated around them.
+		"""
+		for init_st, init_pt in processes:
+			for s, f in init_st:
+				self._update_bm(f, True)
+			for p, s, f in init_pt:
+				self._update_bm(f)
+		for pid, (init_st, init_pt) in enumerate(processes):
+			if not self._activate(pid): raise ValueError("Error: no memory for the st of process %d." % pid)
+			for s, f in init_st:
+				self.init_st(s, f)
+			for p, s, f in init_pt:
+				self.init_pt(p, s, f)
+		self._activate(0)
 
 	def _read_va(self, va):
 		"parses integer into respective s, p, w and sp values"
-		va = bin(va)[2::]
-		(s, p, w, sp) = (va[0:-19], va[-19:-9], va[-9:], va[0:-9])
-		return (s != '' and int(s,2) or 0, p != '' and int(p,2) or 0, w != '' and int(w,2) or 0, sp != '' and int(sp,2) or 0)
+		sp = va >> self.w_bits & self.sp_mask
+		return (sp >> self.p_bits, sp & self.p_mask, va & self.w_mask, sp)
 
 	def _update_bm(self, addr, is_pt=False):
-		"fills in slots in bitmap given an address and if its a pt or not"
-		self.bitmap[addr/512] = 1
-		if is_pt: self.bitmap[addr/512 + 1] = 1
+		"fills in slots in bitmap given an address and if its a pt or not, negative addresses are on disk and have no frame"
+		if addr < 0: return
+		for x in range(is_pt and self.pt_frames or 1):
+			self.bitmap[addr / self.page_size + x] = 1
 
 	def init_st(self, s, f):
-		"initialize st values"
-		self.pm[s] = f
+		"initialize st values of the running process"
+		self.pm[self.st + s] = f
 		self._update_bm(f, True)
 	
 	def init_pt(self, p, s, f):
-		"initialize pt values"
-		self.pm[self.pm[s] + p] = f
+		"initialize pt values of the running process, keeping the values of a pt on the backing store until it is paged in"
+		st_entry = self.pm[self.st + s]
+		if st_entry == -1:
+			self.disk_pts.setdefault(self.st + s, {})[p] = f
+		else:
+			self.pm[st_entry + p] = f
+			if f > 0 and self.paging is not None: self._make_resident(self._space | s << self.p_bits | p, st_entry + p)
 		self._update_bm(f)
 
 
-	def _allocate(self, is_pt=False):
-		"locates free frames in bitmap to allocate"
-		for x in range(len(self.bitmap)):
-			if is_pt:
-				if self.bitmap[x] == 0 and self.bitmap[x + 1] == 0:
-					self.bitmap[x] = 1
-					self.bitmap[x + 1] = 1
-					return x * 512
-			else:
-				if self.bitmap[x] == 0:
-					self.bitmap[x] = 1
-					return x * 512
-
-	def _check_tlb(self, _sp):
-		"checks tlb for sp value"
-		for n, lru, sp, f in self.tlb:
-			if sp == _sp:
-				return n
-		return -1
+	def _allocate_frames(self, count, key=None):
+		"allocates count contiguous frames, evicting pages with demand paging until they are free, returns the first frame or None"
+		frame = self.bitmap.allocate(count)
+		while frame == -1 and self.paging is not None and self.resident:
+			self._evict(key)
+			frame = self.bitmap.allocate(count)
+		if frame != -1:
+			self.allocations += 1
+			return frame
 
-	def _update_tlb(self, _n):
-		"decrements all lru by 1 except given index"
-		for n, lru, sp, f in self.tlb:
-			if n != _n and lru != 0:
-				self.tlb[n][1] -= 1
-
-	def _update_tlb_match(self, _n):
-		"increments the hit tlb's lru to 3"
-		self.tlb[_n][1] = 3
-		self._update_tlb(_n)
-
-	def _update_tlb_miss(self, _sp, _f):
-		"update tlb when a miss occured but a pa is determined"
-		for n, lru, sp, f in self.tlb:
-			if lru == 0:
-				_n = 0
-				break
-		self.tlb[_n] = [_n, 3, _sp, _f]
-		self._update_tlb(_n)
+	def _allocate(self, is_pt=False, key=None):
+		"""
+		allocates free frames from the bitmap, contiguous frames for a pt, returns None if memory is full.
+		with demand paging, pages are evicted to stay within the resident limit and to free frames,
+		key is the page the frame is for.
+		"""
+		if self.paging is not None and not is_pt:
+			while self.resident_limit and len(self.resident) >= self.resident_limit:
+				self._evict(key)
+		frame = self._allocate_frames(is_pt and self.pt_frames or 1, key)
+		if frame is not None: return frame * self.page_size
 
 	def translate_va(self, va, write):
-		"translates the va"
+		"translates the va, a write of 2 is a context switch to the process whose pid is va"
+		if write == 2: return self.switch(va)
 		(s, p, w, sp) = self._read_va(va) # gets the seperate va components
+		self.refs += 1
 		if self.use_tlb: # checks tlb if enabled
-			n = self._check_tlb(sp)
-			if n != -1: # if match is found, update tlb and return pa
-				self._update_tlb_match(n)
-				return (self.tlb[n][3] + w, "h")
-		st_entry = self.pm[s] # get st entry
-		if st_entry == -1: return ("pf", "x") # page fault
-		if st_entry == 0: 
-			if(write): # make new pt
-				st_entry = self._allocate(True)
-				self.pm[s] = st_entry
-			else: # if not write throw error
-				return ("err", "x")
+			f = self.tlb.lookup(self._tag | sp)
+			if f is not None: # if match is found, return pa
+				self.translated += 1
+				if self.paging is not None: self._touch(self._space | sp, write)
+				return (f + w, "h")
+			if self.huge_tlb is not None: # checks the tlb of huge pages
+				f = self.huge_tlb.lookup(self._tag | s)
+				if f is not None:
+					self.translated += 1
+					return (f + (p << self.w_bits | w), "h")
+		return self._walk(s, p, w, sp, write)
+
+	def _walk(self, s, p, w, sp, write):
+		"translates the va through the st and pt of the running process when it is not in the tlb"
+		key = self._space | sp
+		st_entry = self.pwc is not None and self.pwc.lookup(self._tag | s) or None
+		if st_entry is not None: # st entry from the page walk cache
+			self.walk_refs_saved += 1
+		else:
+			self.walk_refs += 1
+			st_entry = self.pm[self.st + s] # get st entry
+			if st_entry == -1: # page fault, page in the pt with demand paging
+				if self.paging is None: return self._fail("pf")
+				st_entry = self._page_in_pt(s)
+				if st_entry is None: return self._fail("err") # out of memory
+			if st_entry == 0: 
+				if(write): # make new pt, or a huge page
+					st_entry = self.huge and self._allocate_huge(s) or self._allocate(True)
+					if st_entry is None: return self._fail("err") # out of memory
+					self.pm[self.st + s] = st_entry
+				else: # if not write throw error
+					return self._fail("err")
+			if self.pwc is not None: self.pwc.insert(self._tag | s, st_entry)
+		if self.st + s in self.huge_segments: # the st entry is a huge page, there is no pt to read
+			self.walk_refs_saved += 1
+			if self.use_tlb: self.huge_tlb.insert(self._tag | s, st_entry)
+			self.translated += 1
+			return (st_entry + (p << self.w_bits | w), "m")
+		self.walk_refs += 1
 		pt_entry = self.pm[st_entry + p] # get pt entry
-		if pt_entry == -1: return ("pf", "x") # page fault
-		if pt_entry == 0:
+		if pt_entry == -1: # page fault, page in the page with demand paging
+			if self.paging is None: return self._fail("pf")
+			pt_entry = self._page_in(key, st_entry + p)
+			if pt_entry is None: return self._fail("err") # out of memory
+		elif pt_entry == 0:
 			if(write): # make new page
-				pt_entry = self._allocate()
+				pt_entry = self._allocate(False, key)
+				if pt_entry is None: return self._fail("err") # out of memory
 				self.pm[st_entry + p] = pt_entry
+				if self.paging is not None: self._make_resident(key, st_entry + p)
 			else: # if not write throw error
-				return ("err", "x")
+				return self._fail("err")
+		elif self.paging is not None: # reference to a resident page
+			self.paging.touch(key)
+		if write and self.paging is not None: self.dirty.add(key)
 		if self.use_tlb: # if tlb is enabled update it
-			self._update_tlb_miss(sp, pt_entry)
+			self.tlb.insert(self._tag | sp, pt_entry)
+		self.translated += 1
 		return (pt_entry + w, "m")
 
-def process_files(setupfile, translatefile):
-	# driver method for handling 2 text file input and output
-    if path.exists(setupfile) and path.exists(translatefile):
+	def _allocate_huge(self, s):
+		"allocates the contiguous frames of a huge page mapping segment s of the running process, returns its address or None"
+		frame = self.bitmap.allocate(self.huge_frames)
+		if frame == -1: return None
+		self.allocations += 1
+		self.huge_segments.add(self.st + s)
+		return frame * self.page_size
+
+	def _touch(self, key, write):
+		"records a reference to a resident page for its replacement policy, writes make it dirty"
+		self.paging.touch(key)
+		if write: self.dirty.add(key)
+
+	def _make_resident(self, key, entry):
+		"adds a page to the resident set, entry is the address of its pt entry"
+		self.resident[key] = entry
+		self.paging.insert(key)
+
+	def _page_in(self, key, entry):
+		"services a page fault by reading the page from the backing store into a frame, returns the frame or None"
+		self.faults += 1
+		self.paging.miss(key)
+		frame = self._allocate(False, key)
+		if frame is None: return None
+		self.page_ins += 1
+		self.pm[entry] = frame
+		self._make_resident(key, entry)
+		return frame
+
+	def _page_in_pt(self, s):
+		"services a page fault on a pt of the running process by reading it from the backing store, returns its address or None"
+		self.faults += 1
+		st_entry = self._allocate(True)
+		if st_entry is None: return None
+		self.page_ins += 1
+		self.pm[self.st + s] = st_entry
+		for p, f in self.disk_pts.pop(self.st + s, {}).iteritems():
+			self.pm[st_entry + p] = f
+			if f > 0: self._make_resident(self._space | s << self.p_bits | p, st_entry + p)
+		return st_entry
+
+	def _evict(self, incoming=None):
+		"evicts the victim of the replacement policy to the backing store, writing it back if it is dirty"
+		key = self.paging.evict(incoming)
+		entry = self.resident.pop(key)
+		self.bitmap.release(self.pm[entry] / self.page_size)
+		self.pm[entry] = -1
+		# an untagged tlb only holds entries of the running process
+		if self.tagged: self.tlb.invalidate(key)
+		elif key >> self.sp_bits == self.pid: self.tlb.invalidate(key & self.sp_mask)
+		self.evictions += 1
+		if key in self.dirty:
+			self.dirty.discard(key)
+			self.writebacks += 1
+
+	def _fail(self, result):
+		"counts a failed translation and returns its result"
+		if result == "pf": self.faults += 1
+		else: self.errors += 1
+		return (result, "x")
+
+	def translate_batch(self, vas, writes):
+		"""
+		translates a sequence of vas with a matching sequence of write flags and returns the list of
+		results of translate_va. tlb hits and walks through a resident pt to a resident page, which
+		are most references, are translated inline without a method call per reference.
+		anything that needs an allocation or faults falls back to _walk.
+		"""
+		results = []
+		append = results.append
+		pm, tlb, use_tlb, walk, paging, touch = self.pm, self.tlb, self.use_tlb, self._walk, self.paging, self._touch
+		w_bits, p_bits, w_mask, p_mask, sp_mask = self.w_bits, self.p_bits, self.w_mask, self.p_mask, self.sp_mask
+		st, space, tag = self.st, self._space, self._tag
+		hits = walks = 0
+		huge_tlb, huge_mask = use_tlb and self.huge_tlb or None, self.huge_mask
+		inline = self.pwc is None and not self.huge # walks only go through pm without a pwc or huge pages
+		for va, write in izip(vas, writes):
+			if write == 2: # context switch
+				append(self.switch(va))
+				st, space, tag = self.st, self._space, self._tag
+				continue
+			sp = va >> w_bits & sp_mask
+			if use_tlb:
+				f = tlb.lookup(tag | sp)
+				if f is not None:
+					hits += 1
+					if paging is not None: touch(space | sp, write)
+					append((f + (va & w_mask), "h"))
+					continue
+				if huge_tlb is not None:
+					f = huge_tlb.lookup(tag | sp >> p_bits)
+					if f is not None:
+						hits += 1
+						append((f + (va & huge_mask), "h"))
+						continue
+			if inline:
+				st_entry = pm[st + (sp >> p_bits)]
+				if st_entry > 0:
+					pt_entry = pm[st_entry + (sp & p_mask)]
+					if pt_entry > 0:
+						walks += 1
+						if paging is not None: touch(space | sp, write)
+						if use_tlb: tlb.insert(tag | sp, pt_entry)
+						append((pt_entry + (va & w_mask), "m"))
+						continue
+			self.refs += 1
+			append(walk(sp >> p_bits, sp & p_mask, va & w_mask, sp, write))
+		self.refs += hits + walks
+		self.translated += hits + walks
+		self.walk_refs += 2 * walks
+		return results
+
+	def stats(self):
+		"""
+		returns a dictionary of the counters of the vm and its tlb, and the simulated cost of translating
+		and accessing every reference, a tlb lookup per reference if the tlb is used, a memory reference
+		for every pm read of a walk and every successful translation, and a disk access for every page in
+		and write back.
+		"""
+		stats = {"refs": self.refs, "translated": self.translated, "walk_refs": self.walk_refs,
+				 "faults": self.faults, "errors": self.errors, "allocations": self.allocations,
+				 "page_ins": self.page_ins, "evictions": self.evictions, "writebacks": self.writebacks, "resident": len(self.resident),
+				 "switches": self.switches, "flushes": self.flushes, "processes": len(self.sts),
+				 "walk_refs_saved": self.walk_refs_saved, "huge_pages": len(self.huge_segments)}
+		stats.update(("tlb_" + key, value) for key, value in self.tlb.stats().items())
+		if self.pwc is not None: stats.update(("pwc_" + key, value) for key, value in self.pwc.stats().items())
+		if self.huge_tlb is not None: stats.update(("huge_tlb_" + key, value) for key, value in self.huge_tlb.stats().items())
+		cycles = (self.use_tlb and self.refs * TLB_CYCLES or 0) + (self.walk_refs + self.translated) * MEMORY_CYCLES + \
+				 (self.page_ins + self.writebacks) * DISK_CYCLES
+		stats["cycles"] = cycles
+		stats["cycles_per_ref"] = self.refs and float(cycles) / self.refs or 0.0
+		return stats
+
+TRACE_HEADER = struct.Struct("<4sI") # magic and version of a binary trace
+TRACE_MAGIC = "VMTB"
+CHUNK_SIZE = 65536 # references read and translated at a time
+BUFFER_SIZE = 1 << 20 # bytes buffered by output files
+QUEUE_SIZE = 8 # chunks buffered for each sweep worker
+POLL_TIMEOUT = 5 # seconds to wait on a sweep worker before checking it is still running
+SNAPSHOT_HEADER = struct.Struct("<4sIQ") # magic, version and trace position of a snapshot
+SNAPSHOT_MAGIC = "VMSS"
+SNAPSHOT_NAME = "snapshot-%d.vmss" # name of the checkpoint taken after a number of references
+
+# settings of a sweep configuration mapped to the Vm keyword argument they set and their type
+CONFIG_SETTINGS = {"tlb": ("tlb_size", int), "ways": ("tlb_ways", int), "policy": ("tlb_policy", str),
+				   "frames": ("frames", int), "sparse": ("sparse", int), "s": ("s_bits", int), "p": ("p_bits", int), "w": ("w_bits", int),
+				   "paging": ("paging", str), "resident": ("resident", int), "asid": ("tagged", int),
+				   "pwc": ("pwc", int), "huge": ("huge", int), "huge_tlb": ("huge_tlb", int)}
+
+def _text_chunks(trace_file, data, chunk_size):
+	"tokenizes a text trace into arrays of up to 2 * chunk_size integers, keeping tokens split across reads"
+	partial = ""
+	while data:
+		tokens = (partial + data).split()
+		partial = not data[-1].isspace() and tokens and tokens.pop() or ""
+		if tokens: yield array('l', map(int, tokens))
+		data = trace_file.read(chunk_size * 16)
+	if partial: yield array('l', [int(partial)])
+
+def _binary_chunks(trace_file, chunk_size):
+	"reads a binary trace into arrays of up to 2 * chunk_size integers"
+	while True:
+		data = trace_file.read(chunk_size * 8)
+		if not data: break
+		if len(data) % 4: raise ValueError("Error: truncated binary trace.")
+		words = array('I', data)
+		if sys.byteorder == "big": words.byteswap()
+		yield words
+
+def read_trace(trace_file, chunk_size=CHUNK_SIZE, skip=0):
+	"""
+	reads a trace of rw and va pairs a chunk at a time, yielding arrays of the write flags and vas
+	of up to chunk_size references, so memory use does not grow with the length of the trace.
+	binary traces start with a header and hold each pair as 2 little endian unsigned 32 bit ints,
+	anything else is read as a text trace of whitespace separated integers.
+	the first skip references are fast forwarded past, by seeking in a binary trace and by
+	tokenizing without translating in a text trace.
+	"""
+	data = trace_file.read(TRACE_HEADER.size)
+	if data[:4] == TRACE_MAGIC:
+		trace_file.seek(8 * skip, 1)
+		skip = 0
+		chunks = _binary_chunks(trace_file, chunk_size)
+	else:
+		chunks = _text_chunks(trace_file, data, chunk_size)
+	odd = None # a rw whose va is in the next chunk
+	for words in chunks:
+		if odd is not None: words.insert(0, odd)
+		odd = None
+		if len(words) % 2: odd = words.pop()
+		if skip: # fast forward through a text trace
+			skipped = min(skip, len(words) / 2)
+			skip -= skipped
+			words = words[2 * skipped:]
+			if not words: continue
+		yield words[0::2], words[1::2]
+	if odd is not None: raise ValueError("Error: trace ends with a rw without a va.")
+
+def convert_trace(textfile, binaryfile, chunk_size=CHUNK_SIZE):
+	"converts a text trace into a binary trace"
+	with open(textfile, "rb") as rtextfile:
+		with open(binaryfile, "wb") as wbinaryfile:
+			wbinaryfile.write(TRACE_HEADER.pack(TRACE_MAGIC, 1))
+			for writes, vas in read_trace(rtextfile, chunk_size):
+				words = array('I', [0]) * (2 * len(vas))
+				words[0::2], words[1::2] = array('I', writes), array('I', vas)
+				if sys.byteorder == "big": words.byteswap()
+				words.tofile(wbinaryfile)
+		wbinaryfile.close()
+	rtextfile.close()
+
+def _checkpoint_chunks(chunks, position, checkpoint=0):
+	"""
+	yields the write flags and vas of chunks of the trace with the position in the trace after them,
+	splitting chunks at every multiple of checkpoint references
+	"""
+	for writes, vas in chunks:
+		start = 0
+		while start < len(vas):
+			end = checkpoint and min(len(vas), start + checkpoint - position % checkpoint) or len(vas)
+			position += end - start
+			if start == 0 and end == len(vas):
+				yield writes, vas, position
+			else:
+				yield writes[start:end], vas[start:end], position
+			start = end
+
+def save_snapshot(snapshotfile, position, vms):
+	"""
+	writes a snapshot of a dictionary of vms taken after position references of the trace, a header
+	followed by the pickled vms. their memories, bitmaps, tlbs, page tables and counters are all
+	restored by load_snapshot.
+	"""
+	with open(snapshotfile, "wb") as wsnapshotfile:
+		wsnapshotfile.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, 1, position))
+		cPickle.dump(vms, wsnapshotfile, cPickle.HIGHEST_PROTOCOL)
+	wsnapshotfile.close()
+
+def load_snapshot(snapshotfile):
+	"reads a snapshot and returns the position in the trace it was taken at and its dictionary of vms"
+	with open(snapshotfile, "rb") as rsnapshotfile:
+		header = rsnapshotfile.read(SNAPSHOT_HEADER.size)
+		if len(header) < SNAPSHOT_HEADER.size or header[:4] != SNAPSHOT_MAGIC:
+			raise ValueError("Error: %s is not a snapshot." % snapshotfile)
+		magic, version, position = SNAPSHOT_HEADER.unpack(header)
+		vms = cPickle.load(rsnapshotfile)
+	rsnapshotfile.close()
+	return position, vms
+
+def read_setup(setupfile):
+	"""
+	reads the setup file into a list of the st values and pt values of every process. every process
+	has a line of st values followed by a line of pt values, starting from process 0.
+	"""
+	processes = []
+	with open(setupfile, "r") as rsetupfile:
+		lines = iter(rsetupfile.readline, "")
+		for st_line in lines:
+			pt_line = next(lines, "")
+			if not (st_line.strip() or pt_line.strip()): continue
+			init_st = imap(int, st_line.split())
+			init_pt = imap(int, pt_line.split())
+			processes.append((zip(init_st, init_st), zip(init_pt, init_pt, init_pt)))
+	rsetupfile.close()
+	return processes
+
+def setup_vm(vm, processes):
+	"puts the st and pt values of every process of the setup file into vm and returns it"
+	vm.setup(processes)
+	return vm
+
+def process_files(setupfile, translatefile, chunk_size=CHUNK_SIZE, checkpoint=0, restore=None, **kwargs):
+	"""
+	driver method for handling 2 text file input and output, kwargs are passed on to both vms.
+	the trace is streamed through both vms chunk_size references at a time and results are
+	written through buffered files, so traces far larger than memory can be processed.
+	with checkpoint, a snapshot of both vms is saved next to the outputs every checkpoint references.
+	with restore, both vms are restored from a snapshot instead of the setup file and kwargs, and the
+	trace is fast forwarded to where it was taken, so the outputs only hold the results after it.
+	"""
+	if path.exists(setupfile) and path.exists(translatefile):
 		# setup file inputs and output directories
-        filepath = path.abspath(setupfile)
-        filedir = path.dirname(filepath)
-        output1 = path.join(filedir, "A0112937E1.txt")
-        output2 = path.join(filedir, "A0112937E2.txt")
-        # setup virtual memory, one with tlb one without
-    	vm = Vm()
-    	vmtlb = Vm(True)
-    	# read setup file
-        with open(setupfile, "r") as rsetupfile:
-        	init_data = rsetupfile.readlines()
-       	rsetupfile.close()
-       	# formating input 
-       	init_data = [x.rstrip("\n").rstrip("\r").rstrip("\r\n") for x in init_data]
-       	init_st = [int(x) for x in init_data[0].split(" ")]
-       	init_st = zip(init_st[0::2], init_st[1::2])
-       	# putting st values into vm
-       	for s, f in init_st:
-       		vm.init_st(s, f)
-       		vmtlb.init_st(s, f)
-       	# formatting input
-       	init_pt = [int(x) for x in init_data[1].split(" ")]
-       	init_pt = zip(init_pt[0::3], init_pt[1::3], init_pt[2::3])
-       	# putting pt values into vm
-       	for p, s, f in init_pt:
-       		vm.init_pt(p, s, f)
-       		vmtlb.init_pt(p, s, f)
-       	# open va file
-        with open(translatefile, "r") as rtranslatefile:
-        	trans_data = rtranslatefile.readlines()
-       	rtranslatefile.close()
-       	# formatting input
-       	trans_data = [x.rstrip("\n").rstrip("\r").rstrip("\r\n") for x in trans_data]
-       	trans_data = trans_data[0].split(" ")
-       	trans_data = zip(trans_data[0::2], trans_data[1::2])
-       	# write results to files
-        with open(output1, "w") as writefile1:
-        	with open(output2, "w") as writefile2:
-       			for rw, va in trans_data:
-       				rs1 = vm.translate_va(int(va), int(rw))
-       				rs2 = vmtlb.translate_va(int(va), int(rw))
-       				writefile1.write(str(rs1[0])+" ")
-       				rs2 = (rs2[1] != "x" and str(rs2[1]) + " " or "") + str(rs2[0]) + " "
-       				writefile2.write(rs2)
-       		writefile2.close()  
-       	writefile1.close()       	
-    else:
-        raise ValueError("Error: files do not exist.")
+		filepath = path.abspath(setupfile)
+		filedir = path.dirname(filepath)
+		output1 = path.join(filedir, "A0112937E1.txt")
+		output2 = path.join(filedir, "A0112937E2.txt")
+		if restore is not None: # continue from a snapshot
+			position, vms = load_snapshot(restore)
+			if set(vms) != set(["vm", "vmtlb"]): raise ValueError("Error: %s is not a snapshot of process_files." % restore)
+			vm, vmtlb = vms["vm"], vms["vmtlb"]
+		else:
+			position = 0
+			# setup virtual memory, one with tlb one without
+			vm = Vm(**kwargs)
+			vmtlb = Vm(True, **kwargs)
+			# read setup file, every process has a line of st values and a line of pt values, and put them into vm
+			processes = read_setup(setupfile)
+			setup_vm(vm, processes)
+			setup_vm(vmtlb, processes)
+		# translate the trace a chunk at a time and write results to files
+		with open(translatefile, "rb") as rtranslatefile:
+			with open(output1, "w", BUFFER_SIZE) as writefile1:
+				with open(output2, "w", BUFFER_SIZE) as writefile2:
+					chunks = _checkpoint_chunks(read_trace(rtranslatefile, chunk_size, position), position, checkpoint)
+					for writes, vas, position in chunks:
+						rs1 = vm.translate_batch(vas, writes)
+						rs2 = vmtlb.translate_batch(vas, writes)
+						# context switches have no output
+						writefile1.write("".join([str(pa) + " " for pa, hm in rs1 if hm != "s"]))
+						writefile2.write("".join([(hm != "x" and hm + " " or "") + str(pa) + " " for pa, hm in rs2 if hm != "s"]))
+						if checkpoint and position % checkpoint == 0:
+							save_snapshot(path.join(filedir, SNAPSHOT_NAME % position), position, {"vm": vm, "vmtlb": vmtlb})
+				writefile2.close()
+			writefile1.close()
+		rtranslatefile.close()
+	else:
+		raise ValueError("Error: files do not exist.")
+
+def parse_config(config):
+	"""
+	parses a sweep configuration of comma separated settings into the keyword arguments of a Vm,
+	eg. tlb=16,ways=4,policy=plru,w=10. the tlb is used unless it is given 0 entries.
+	"""
+	kwargs = {"_use_tlb": True}
+	for setting in filter(None, config.split(",")):
+		key, sep, value = setting.partition("=")
+		if not sep or key not in CONFIG_SETTINGS: raise ValueError("Error: invalid setting %s in configuration %s." % (setting, config))
+		name, convert = CONFIG_SETTINGS[key]
+		try:
+			kwargs[name] = convert(value)
+		except ValueError:
+			raise ValueError("Error: invalid setting %s in configuration %s." % (setting, config))
+	if kwargs.get("tlb_size") == 0:
+		kwargs["_use_tlb"] = False
+		del kwargs["tlb_size"]
+	return kwargs
+
+def validate_config(config):
+	"""
+	raises an error if a Vm cannot be built with the settings of a sweep configuration. the vm
+	is built with a sparse memory, so nothing is allocated for the frames of the configuration.
+	"""
+	kwargs = parse_config(config)
+	kwargs["sparse"] = True
+	try:
+		Vm(**kwargs)
+	except ValueError as error:
+		raise ValueError("Error: invalid configuration %s, %s." % (config, error))
+
+class SweepWorker(multiprocessing.Process):
+	"""
+	process that simulates a shard of the configurations of a sweep. chunks of the trace are received
+	as the packed strings of their arrays until a None sentinel, then the stats of every configuration
+	are put on the results queue.
+	"""
+	def __init__(self, configs, setup, chunks, results):
+		multiprocessing.Process.__init__(self)
+		self._configs = configs
+		self._setup = setup
+		self._chunks = chunks
+		self._results = results
+
+	def run(self):
+		"simulates every chunk of the trace on every configuration"
+		vms = [setup_vm(Vm(**parse_config(config)), self._setup) for config in self._configs]
+		for typecode, writes, vas in iter(self._chunks.get, None):
+			writes, vas = array(typecode, writes), array(typecode, vas)
+			for vm in vms:
+				vm.translate_batch(vas, writes)
+		self._results.put([(config, vm.stats()) for config, vm in zip(self._configs, vms)])
+
+def _check_workers(workers):
+	"raises an error if a sweep worker has died"
+	if any(worker.exitcode not in (None, 0) for worker in workers):
+		raise RuntimeError("SweepWorker exited unexpectedly")
+
+def sweep(setupfile, translatefile, configs, workers=0, chunk_size=CHUNK_SIZE, checkpoint=0, restore=None):
+	"""
+	replays the trace through a vm of every configuration in a single pass, and returns a list of every
+	configuration with the stats of its vm. with workers the configurations are divided between that
+	many processes, every chunk of the trace is read once and sent to all of them. stats and snapshots
+	are keyed by configuration, so every configuration must be distinct.
+	without workers, checkpoint and restore save and restore snapshots of the vms of every
+	configuration like process_files, a restored sweep runs the configurations in the snapshot.
+	"""
+	if not (path.exists(setupfile) and path.exists(translatefile)):
+		raise ValueError("Error: files do not exist.")
+	if workers and (checkpoint or restore is not None):
+		raise ValueError("Error: snapshots are only taken and restored by sweeps without workers.")
+	map(validate_config, configs) # fail on invalid configurations before starting
+	duplicates = [config for n, config in enumerate(configs) if config in configs[:n]]
+	if duplicates: raise ValueError("Error: configuration %s is given more than once." % duplicates[0])
+	setup = read_setup(setupfile)
+	stats = {}
+	with open(translatefile, "rb") as rtranslatefile:
+		if not workers:
+			position = 0
+			if restore is not None:
+				position, snapshot = load_snapshot(restore)
+				missing = [config for config in configs if config not in snapshot]
+				if missing: raise ValueError("Error: configuration %s is not in the snapshot." % missing[0])
+				vms = [snapshot[config] for config in configs]
+			else:
+				vms = [setup_vm(Vm(**parse_config(config)), setup) for config in configs]
+			for writes, vas, position in _checkpoint_chunks(read_trace(rtranslatefile, chunk_size, position), position, checkpoint):
+				for vm in vms:
+					vm.translate_batch(vas, writes)
+				if checkpoint and position % checkpoint == 0:
+					snapshotfile = path.join(path.dirname(path.abspath(setupfile)), SNAPSHOT_NAME % position)
+					save_snapshot(snapshotfile, position, dict(zip(configs, vms)))
+			stats = dict((config, vm.stats()) for config, vm in zip(configs, vms))
+		else:
+			results = multiprocessing.Queue()
+			shards = filter(None, [configs[n::workers] for n in xrange(workers)])
+			queues = [multiprocessing.Queue(QUEUE_SIZE) for shard in shards]
+			sweepers = [SweepWorker(shard, setup, queue, results) for shard, queue in zip(shards, queues)]
+			for sweeper in sweepers:
+				sweeper.daemon = True
+				sweeper.start()
+			chunks = ((writes.typecode, writes.tostring(), vas.tostring()) for writes, vas in read_trace(rtranslatefile, chunk_size))
+			try:
+				for chunk in chain(chunks, [None]):
+					for queue in queues:
+						while True:
+							try:
+								queue.put(chunk, timeout=POLL_TIMEOUT)
+								break
+							except Queue.Full:
+								_check_workers(sweepers)
+				while len(stats) < len(configs):
+					try:
+						stats.update(results.get(timeout=POLL_TIMEOUT))
+					except Queue.Empty:
+						_check_workers(sweepers)
+			except:
+				# chunks left in the queue of a dead worker would otherwise keep this process from exiting,
+				# so they are drained and the queues closed without being waited on
+				error = sys.exc_info()
+				for sweeper in sweepers:
+					sweeper.terminate()
+				for queue in queues:
+					queue.cancel_join_thread()
+					try:
+						while True:
+							queue.get(timeout=0.1)
+					except Queue.Empty:
+						pass
+					queue.close()
+				raise error[0], error[1], error[2]
+			for sweeper in sweepers:
+				sweeper.join()
+	rtranslatefile.close()
+	return [(config, stats[config]) for config in configs]
+
+def print_sweep(results):
+	"prints a table comparing the stats of every configuration of a sweep"
+	columns = [("refs", "%d"), ("tlb_hit_rate", "%.4f"), ("tlb_evictions", "%d"), ("walk_refs", "%d"),
+			   ("walk_refs_saved", "%d"), ("faults", "%d"), ("evictions", "%d"), ("writebacks", "%d"), ("errors", "%d"), ("flushes", "%d"), ("cycles_per_ref", "%.2f")]
+	width = max([len("config")] + [len(config) for config, stats in results])
+	print " ".join(["config".ljust(width)] + [name.rjust(14) for name, fmt in columns])
+	for config, stats in results:
+		print " ".join([config.ljust(width)] + [(fmt % stats[name]).rjust(14) for name, fmt in columns])
 
 if __name__ == "__main__":
-	process_files(argv[1], argv[2]) # handle text input files
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument("files", nargs=2, help="setup-file and trace-file, or text-trace and binary-trace with --convert", metavar="file")
+	parser.add_argument("-c", type=int, default=CHUNK_SIZE, help="references translated at a time", metavar="chunk", dest="chunk")
+	parser.add_argument("-f", type=int, default=1024, help="frames of physical memory", metavar="frames", dest="frames")
+	parser.add_argument("--paging", choices=sorted(REPLACEMENT_POLICIES), help="service page faults with demand paging using this replacement policy", dest="paging")
+	parser.add_argument("--resident", type=int, help="limit of resident pages with demand paging", metavar="pages", dest="resident")
+	parser.add_argument("--tagged", action="store_true", help="tag tlb entries with the pid instead of flushing the tlb on context switches", dest="tagged")
+	parser.add_argument("--pwc", type=int, default=0, help="entries of a page walk cache of st entries", metavar="entries", dest="pwc")
+	parser.add_argument("--huge", action="store_true", help="map segments created by writes with huge pages, needs a larger -f than the default, eg. 2048", dest="huge")
+	parser.add_argument("--convert", action="store_true", help="convert a text trace into a binary trace", dest="convert")
+	parser.add_argument("--sweep", nargs="+", help="compare configurations of comma separated settings, eg. tlb=16,ways=4,policy=plru", metavar="config", dest="sweep")
+	parser.add_argument("--checkpoint", type=int, default=0, help="save a snapshot of the vms every n references", metavar="n", dest="checkpoint")
+	parser.add_argument("--restore", help="continue from a snapshot, fast forwarding the trace", metavar="snapshot", dest="restore")
+	parser.add_argument("-w", type=int, default=0, help="processes to divide the sweep configurations between", metavar="workers", dest="workers")
+
+	args = parser.parse_args()
+
+	if args.convert:
+		convert_trace(args.files[0], args.files[1], args.chunk)
+	elif args.sweep:
+		print_sweep(sweep(args.files[0], args.files[1], args.sweep, args.workers, args.chunk, args.checkpoint, args.restore))
+	else:
+		process_files(args.files[0], args.files[1], args.chunk, args.checkpoint, args.restore, frames=args.frames, paging=args.paging, resident=args.resident, tagged=args.tagged,
+					  pwc=args.pwc, huge=args.huge) # handle text input files
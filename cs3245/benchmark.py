@@ -0,0 +1,315 @@
+#!/usr/bin/env python2.7
+
+"""
+Matric: A0112937E
+Email:  a0112937@u.nus.edu
+
+This script benchmarks the search engines of hw2, hw3 and hw4, BooleanSearch, VSSearch and
+PatentSearch. It has 3 commands.
+ - run generates a synthetic corpus with known relevant documents for every query, builds the
+   index of every engine with its index.py, then runs a fixed query workload against every engine.
+   Latency percentiles, throughput, peak memory, index size and build time, and MAP and P@k
+   against the qrels are written to a JSON file.
+ - compare prints the relative change of every metric between two JSON result files, to spot
+   regressions.
+ - query is used internally by run. The engines all use the module names index and search, so
+   each engine's queries are executed in a separate process, which also isolates its peak memory.
+
+The synthetic corpus is made of topics, each with its own vocabulary of made up words. Every
+document is drawn mostly from the vocabulary of one topic and some shared background words, and
+every query is drawn from the vocabulary of one topic, whose documents are its relevant documents.
+
+usage is as follows:
+
+$ python benchmark.py run -o results.json [-w work-directory] [-n documents] [-t topics] [-q queries] [-s seed] [-k k] [--systems hw2 hw3 hw4]
+$ python benchmark.py compare baseline.json results.json
+
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import cPickle
+import argparse
+import resource
+import tempfile
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SYSTEMS = ["hw2", "hw3", "hw4"]
+SYLLABLES = ["ka", "lo", "ri", "mu", "te", "sa", "no", "vi", "pe", "du", "ga", "zo", "fi", "be", "ra", "to"]
+
+# metrics where a higher value is an improvement, for compare
+HIGHER_IS_BETTER = set(["throughput", "map", "precision"])
+
+class CorpusGenerator(object):
+    """
+    Generates the synthetic corpus in the format of every engine, the Reuters style
+    text files named by integer docids of hw2 and hw3 and the patent xml files of hw4,
+    along with the query workload and qrels.
+    """
+
+    words_per_topic = 40
+    background_words = 200
+    topic_fraction = 0.7 # fraction of a document's words from its topic
+    query_length = 4
+    ipc_labels = ["a01b", "b60l", "g02b", "h01m", "h04w", "f02b"]
+
+    def __init__(self, num_docs, num_topics, num_queries, seed):
+        """generates the vocabularies and assigns every document to a topic"""
+        self._random = random.Random(seed)
+        words = set()
+        while len(words) < num_topics * self.words_per_topic + self.background_words:
+            words.add("".join(self._random.choice(SYLLABLES) for x in xrange(self._random.randint(3, 4))))
+        words = sorted(words)
+        self._random.shuffle(words)
+        self.topics = [words[n * self.words_per_topic:(n + 1) * self.words_per_topic] for n in xrange(num_topics)]
+        self.background = words[num_topics * self.words_per_topic:]
+        self.doc_topics = [self._random.randrange(num_topics) for x in xrange(num_docs)]
+        self.query_topics = [n % num_topics for n in xrange(num_queries)]
+
+    def _document(self, topic):
+        """returns the words of a document of a topic"""
+        length = self._random.randint(30, 120)
+        return [self._random.random() < self.topic_fraction and self._random.choice(self.topics[topic])
+                or self._random.choice(self.background) for x in xrange(length)]
+
+    def _query(self, topic):
+        """returns the words of a query of a topic"""
+        return self._random.sample(self.topics[topic], self.query_length)
+
+    def qrels(self, docids):
+        """returns the set of relevant docids of every query"""
+        return [set(docid for docid, topic in zip(docids, self.doc_topics) if topic == query_topic)
+                for query_topic in self.query_topics]
+
+    def write_text_corpus(self, directory):
+        """writes the hw2 and hw3 corpus, returning the docids"""
+        os.makedirs(directory)
+        docids = [str(n + 1) for n in xrange(len(self.doc_topics))]
+        for docid, topic in zip(docids, self.doc_topics):
+            with open(os.path.join(directory, docid), 'w') as doc_file:
+                doc_file.write(" ".join(self._document(topic)) + ".\n")
+        return docids
+
+    def write_patent_corpus(self, directory):
+        """writes the hw4 corpus, returning the docids"""
+        os.makedirs(directory)
+        docids = ["EP%07d" % (n + 1) for n in xrange(len(self.doc_topics))]
+        for docid, topic in zip(docids, self.doc_topics):
+            words = self._document(topic)
+            ipc = self.ipc_labels[topic % len(self.ipc_labels)].upper() + " %d/%02d" % (topic + 1, topic % 100)
+            with open(os.path.join(directory, docid + ".xml"), 'w') as doc_file:
+                doc_file.write('<doc><str name="Title">%s</str><str name="Abstract">%s</str><str name="All IPC">%s</str></doc>'
+                               % (" ".join(words[:8]), " ".join(words[8:]), ipc))
+        return docids
+
+    def write_ipc(self, filename):
+        """writes a pickled IPC description dictionary for hw4 document expansion"""
+        ipc = {label: self._random.sample(self.background, 5) for label in self.ipc_labels}
+        with open(filename, 'wb') as ipc_file:
+            cPickle.dump(ipc, ipc_file)
+        ipc_file.close()
+
+    def write_boolean_queries(self, filename):
+        """writes the hw2 queries, ANDs of two topic words ORed with another pair"""
+        with open(filename, 'w') as query_file:
+            for topic in self.query_topics:
+                words = self._query(topic)
+                query_file.write("%s AND %s OR %s AND %s\n" % tuple(words))
+
+    def write_free_text_queries(self, filename):
+        """writes the hw3 queries, one free text query per line"""
+        with open(filename, 'w') as query_file:
+            for topic in self.query_topics:
+                query_file.write(" ".join(self._query(topic)) + "\n")
+
+    def write_patent_queries(self, directory):
+        """writes the hw4 queries, one xml file per query, returning their filenames"""
+        os.makedirs(directory)
+        filenames = []
+        for n, topic in enumerate(self.query_topics):
+            words = self._query(topic)
+            filenames.append(os.path.join(directory, "q%d.xml" % (n + 1)))
+            with open(filenames[-1], 'w') as query_file:
+                query_file.write("<query><title>%s</title><description>%s</description></query>"
+                                 % (" ".join(words[:2]), " ".join(words)))
+        return filenames
+
+def percentile(values, p):
+    """nearest rank percentile of a list of values"""
+    values = sorted(values)
+    if len(values) == 0:
+        return 0.0
+    return values[max(0, int(-(-p * len(values) // 100)) - 1)]
+
+def average_precision(results, relevant):
+    """average precision of a ranked list of docids"""
+    hits = 0
+    total = 0.0
+    for rank, docid in enumerate(results, 1):
+        if docid in relevant:
+            hits += 1
+            total += float(hits) / rank
+    return len(relevant) > 0 and total / len(relevant) or 0.0
+
+def precision_at(results, relevant, k):
+    """precision of the top k docids of a ranked list"""
+    return float(len([docid for docid in results[:k] if docid in relevant])) / k
+
+def file_size(*filenames):
+    """total size in bytes of the files that exist"""
+    return sum(os.path.getsize(filename) for filename in filenames if os.path.exists(filename))
+
+def build_index(system, corpus_dir, work_dir):
+    """
+    builds the index of an engine with its index.py, returning the dictionary
+    and postings filenames and the build time in seconds.
+    """
+    dict_filename = os.path.join(work_dir, "dictionary.txt")
+    postings_filename = os.path.join(work_dir, "postings.txt")
+    command = [sys.executable, os.path.join(BASE_DIR, system, "index.py"), "-i", corpus_dir, "-d", dict_filename, "-p", postings_filename]
+    if system == "hw4":
+        command += ["-f", os.path.join(work_dir, "forward.txt")]
+    start = time.time()
+    subprocess.check_call(command, cwd=work_dir)
+    return dict_filename, postings_filename, time.time() - start
+
+def run_queries(system, dict_filename, postings_filename, queries):
+    """
+    executes the queries against an engine in this process, returning the results
+    and latency of every query, the index load time and the peak resident memory in KB.
+    Only called by the query command, in a process of its own.
+    """
+    sys.path.insert(0, os.path.join(BASE_DIR, system))
+    import search
+    start = time.time()
+    if system == "hw2":
+        engine = search.BooleanSearch(dict_filename, postings_filename)
+        execute = lambda query: str(engine._execute_query(query)).split()
+    elif system == "hw3":
+        engine = search.VSSearch(dict_filename, postings_filename)
+        execute = engine._execute_query
+    else:
+        engine = search.PatentSearch(dict_filename, postings_filename)
+        execute = lambda query: engine.search(query)[0]
+    load_time = time.time() - start
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.time()
+        results.append(execute(query))
+        latencies.append(time.time() - start)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"results": results, "latencies": latencies, "load_time": load_time, "peak_rss_kb": peak_rss}
+
+def benchmark_system(system, generator, work_dir, k):
+    """generates the corpus of an engine, builds its index and measures its query workload"""
+    system_dir = os.path.join(work_dir, system)
+    os.makedirs(system_dir)
+    if system == "hw4":
+        docids = generator.write_patent_corpus(os.path.join(system_dir, "corpus"))
+        generator.write_ipc(os.path.join(system_dir, "IPC.txt"))
+        queries = generator.write_patent_queries(os.path.join(system_dir, "queries"))
+    else:
+        docids = generator.write_text_corpus(os.path.join(system_dir, "corpus"))
+        queries_filename = os.path.join(system_dir, "queries.txt")
+        if system == "hw2":
+            generator.write_boolean_queries(queries_filename)
+        else:
+            generator.write_free_text_queries(queries_filename)
+        with open(queries_filename, 'r') as query_file:
+            queries = [line.strip() for line in query_file]
+    dict_filename, postings_filename, build_time = build_index(system, os.path.join(system_dir, "corpus"), system_dir)
+    workload_filename = os.path.join(system_dir, "workload.json")
+    with open(workload_filename, 'w') as workload_file:
+        json.dump({"system": system, "dict": dict_filename, "postings": postings_filename, "queries": queries}, workload_file)
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "query", workload_filename], cwd=system_dir)
+    measured = json.loads(output.splitlines()[-1])
+    latencies = measured["latencies"]
+    qrels = generator.qrels(docids)
+    return {"documents": len(docids),
+            "queries": len(queries),
+            "build_time": build_time,
+            "index_size": file_size(dict_filename, postings_filename, os.path.join(system_dir, "forward.txt")),
+            "load_time": measured["load_time"],
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_p99": percentile(latencies, 99),
+            "throughput": sum(latencies) > 0 and len(latencies) / sum(latencies) or 0.0,
+            "peak_rss_kb": measured["peak_rss_kb"],
+            "map": sum(average_precision(results, relevant) for results, relevant in zip(measured["results"], qrels)) / len(qrels),
+            "precision_at_%d" % k: sum(precision_at(results, relevant, k) for results, relevant in zip(measured["results"], qrels)) / len(qrels)}
+
+def run(args):
+    """runs the benchmark of every selected engine and writes the results"""
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="cs3245-benchmark-")
+    generator_args = (args.documents, args.topics, args.queries, args.seed)
+    report = {"config": {"documents": args.documents, "topics": args.topics, "queries": args.queries, "seed": args.seed, "k": args.k},
+              "systems": {}}
+    try:
+        for system in args.systems:
+            # every engine gets the same corpus and workload from an identically seeded generator
+            report["systems"][system] = benchmark_system(system, CorpusGenerator(*generator_args), work_dir, args.k)
+            print "%s: %s" % (system, json.dumps(report["systems"][system], sort_keys=True))
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2, sort_keys=True)
+
+def compare(args):
+    """prints the relative change of every metric of every engine between two result files"""
+    with open(args.baseline, 'r') as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.results, 'r') as results_file:
+        results = json.load(results_file)
+    for system in sorted(set(baseline["systems"]) & set(results["systems"])):
+        print system
+        for metric in sorted(results["systems"][system]):
+            old = baseline["systems"][system].get(metric)
+            new = results["systems"][system][metric]
+            if old is None:
+                continue
+            change = old and (new - old) / float(old) * 100 or 0.0
+            better = any(metric.startswith(name) for name in HIGHER_IS_BETTER) and change > 0 or \
+                     not any(metric.startswith(name) for name in HIGHER_IS_BETTER) and change < 0
+            print "  %-16s %14.6g %14.6g %+8.1f%% %s" % (metric, old, new, change, change != 0 and (better and "better" or "worse") or "")
+
+def query(args):
+    """executes the workload file written by run and prints the measurements as json"""
+    with open(args.workload, 'r') as workload_file:
+        workload = json.load(workload_file)
+    queries = [str(query) for query in workload["queries"]]
+    measured = run_queries(workload["system"], str(workload["dict"]), str(workload["postings"]), queries)
+    print json.dumps(measured)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers()
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("-o", required=True, help="output-file-of-results", metavar="output", dest="output")
+    run_parser.add_argument("-w", help="work directory to keep the corpora and indexes in", metavar="work", dest="work_dir")
+    run_parser.add_argument("-n", type=int, default=2000, help="number of documents", metavar="documents", dest="documents")
+    run_parser.add_argument("-t", type=int, default=20, help="number of topics", metavar="topics", dest="topics")
+    run_parser.add_argument("-q", type=int, default=100, help="number of queries", metavar="queries", dest="queries")
+    run_parser.add_argument("-s", type=int, default=0, help="random seed", metavar="seed", dest="seed")
+    run_parser.add_argument("-k", type=int, default=10, help="k of precision at k", metavar="k", dest="k")
+    run_parser.add_argument("--systems", nargs="+", choices=SYSTEMS, default=SYSTEMS, help="engines to benchmark", dest="systems")
+    run_parser.set_defaults(command=run)
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline", help="baseline results file")
+    compare_parser.add_argument("results", help="results file")
+    compare_parser.set_defaults(command=compare)
+
+    query_parser = commands.add_parser("query")
+    query_parser.add_argument("workload", help="workload file written by run")
+    query_parser.set_defaults(command=query)
+
+    args = parser.parse_args()
+    args.command(args)
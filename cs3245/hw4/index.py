@@ -4,46 +4,57 @@
 Matric: A0112937E
 Email:  a0112937@u.nus.edu
 
-This script contains 2 classes and 2 helper methods.
- - CorpusParser is a multiprocessing worker class that handles the parsing of individual 
+This script contains 2 classes and 5 helper methods.
+ - CorpusParser is a multiprocessing worker class that handles the parsing of chunks of
    files that it receives from a queue that is filled by the CorpusIndexer instance.
-   It returns the results into a result queue which the CorpusIndexer then consumes.
+   It returns each chunk as a batched partial index of term id arrays into a result queue
+   which the CorpusIndexer then consumes.
    It is the consumer in a consumer/producer pattern.
- - CorpusIndexer is the main management class that handles the worker processes. Once
-   the worker processes have processed the input files into suitable data structures, it
-   will perform post processing of the results so that they can be appropriatedly serialized
-   It is the producer in a consumer/producer pattern.
+ - CorpusIndexer is the main management class that handles the worker processes. Tasks are
+   fed to the workers from a separate thread while the results are consumed and merged into
+   the postings as they arrive, so neither queue ever holds more than a bounded number of
+   entries. It will perform post processing of the results so that they can be appropriatedly
+   serialized. It is the producer in a consumer/producer pattern.
 
 Usage is as follows:
 
-$ python index.py -i directory-of-documents -d dictionary-file -p postings-file
+$ python index.py -i directory-of-documents -d dictionary-file -p postings-file [-f forward-index-file] [-t nltk]
 
 """
 import os
 import nltk
+import Queue
 import parsers
 import cPickle
 import argparse
 import itertools
+import struct
+import threading
 import multiprocessing
 from math import log10
+from array import array
 from collections import Counter
 from collections import defaultdict      
 
 class CorpusParser(multiprocessing.Process):
     """
     A multiprocessing worker class that consumes work from CorpusIndexer.
-    The queue it consumes from is expected to contain a tuple of the
-    file name and full file path of the corpus files to be indexed.
+    The queue it consumes from is expected to contain chunks, lists of tuples of
+    the file name and full file path of the corpus files to be indexed.
+    A None task tells the worker to shut down, which it acknowledges by
+    putting None into the result queue.
     """
 
-    def __init__(self, event, tasks, results, ipc):
-        """ipc refers to the index of ipc labels to a bag of words description that label"""
+    def __init__(self, tasks, results, ipc, tagger=None):
+        """
+        ipc refers to the shared parsers.IpcTable of ipc labels to a bag of words description that label
+        tagger is either None or "nltk", the part of speech tagger used to precompute tags.
+        """
         multiprocessing.Process.__init__(self)
-        self._event = event
         self._tasks = tasks
         self._results = results
         self._ipc = ipc
+        self._tagger = tagger
         self.daemon = True
 
     def _process_task(self, file_name, full_file_path):
@@ -51,26 +62,62 @@ class CorpusParser(multiprocessing.Process):
         The main method that handles the processing of the corpus files.
         Uses the methods from the parsers module to parse the corpus file,
         tokenize and process text into proper terms, expand the document, using
-        the ipc descriptions, and computes the lnc score.
+        the ipc descriptions, and computes the lnc score. The term frequencies of
+        the document before expansion are kept for query expansion, and if a tagger
+        is set the counts of the part of speech tags of every stem.
         """
         file_name = file_name.split('.')[0]
         raw_terms, terms, ipc_list = parsers.parse_corpus_xml(full_file_path)
-        terms = parsers.expand_terms(self._ipc, terms, ipc_list)
-        counter = Counter(terms)
+        term_freqs = Counter(terms)
+        counter = parsers.expand_terms(self._ipc, term_freqs, ipc_list)
         lnc_scores = {}
         # level 2 normalized document length
         length = sum(map(lambda x: ((1 + log10(int(x))) * 1)**2 , counter.values())) ** 0.5
         for term in counter:
             lnc_scores[term]  = ((1 + log10(counter[term])) * 1) / length
-        return (file_name, counter, lnc_scores, raw_terms, ipc_list)
+        tag_counts = Counter()
+        if self._tagger == "nltk":
+            tag_counts.update((parsers.stem_term(term), tag) for term, tag in parsers.tag_terms(raw_terms))
+        return (file_name, lnc_scores, term_freqs, raw_terms, ipc_list, tag_counts)
+
+    def _process_chunk(self, chunk):
+        """
+        Processes a chunk of corpus files into a batched partial index. Terms are
+        replaced by ids into vocabularies local to the batch, and the entries of every
+        document are concatenated into flat arrays delimited by an offsets array.
+        The arrays are sent as raw bytes, as they would otherwise be pickled as lists.
+        """
+        docids, ipcs, terms, rterms = [], [], [], []
+        term_ids, rterm_ids = {}, {}
+        offsets, tids, lncs = array('I', [0]), array('I'), array('d')
+        roffsets, rtids = array('I', [0]), array('I')
+        voffsets, vtids, vtfs = array('I', [0]), array('I'), array('I')
+        tags = Counter()
+        for file_name, full_file_path in chunk:
+            file_name, lnc_scores, term_freqs, raw_terms, ipc_list, tag_counts = self._process_task(file_name, full_file_path)
+            tags.update(tag_counts)
+            docids.append(file_name)
+            ipcs.append([ipc[1] for ipc in ipc_list])
+            for term, lnc_score in lnc_scores.iteritems():
+                tids.append(intern_term(term_ids, terms, term))
+                lncs.append(lnc_score)
+            offsets.append(len(tids))
+            rtids.extend(intern_term(rterm_ids, rterms, term) for term in raw_terms)
+            roffsets.append(len(rtids))
+            for term, term_freq in term_freqs.iteritems():
+                vtids.append(intern_term(term_ids, terms, term))
+                vtfs.append(term_freq)
+            voffsets.append(len(vtids))
+        return {"docid": docids, "ipc": ipcs, "terms": terms, "rterms": rterms, "tags": dict(tags),
+                "offsets": offsets.tostring(), "tid": tids.tostring(), "lnc": lncs.tostring(),
+                "roffsets": roffsets.tostring(), "rtid": rtids.tostring(),
+                "voffsets": voffsets.tostring(), "vtid": vtids.tostring(), "vtf": vtfs.tostring()}
 
     def run(self):
         """run method for CorpusParser worker process"""
-        while self._event.is_set():
-            task = self._tasks.get()
-            result = self._process_task(*task)
-            self._results.put(result)
-            self._tasks.task_done()
+        for chunk in iter(self._tasks.get, None):
+            self._results.put(self._process_chunk(chunk))
+        self._results.put(None)
 
 class CorpusIndexer():
     """
@@ -80,11 +127,18 @@ class CorpusIndexer():
     """
 
     _NUM_WORKERS = multiprocessing.cpu_count()
+    _CHUNK_SIZE = 64 # number of files dispatched to a worker per task
+    _QUEUE_SIZE = 4 * _NUM_WORKERS # bound on pending chunks and unconsumed batches
+    _POLL_TIMEOUT = 5 # seconds to wait for a result before checking on the workers
 
-    def __init__(self):
-        """init"""
-        self._event = multiprocessing.Event()
-        self._tasks = multiprocessing.JoinableQueue()
+    def __init__(self, tagger=None):
+        """
+        tagger is either None or "nltk", the part of speech tagger used to
+        precompute the most frequent tag of every stem in the corpus.
+        """
+        self._tagger = tagger
+        self._tasks = multiprocessing.Queue(self._QUEUE_SIZE)
+        self._results = multiprocessing.Queue(self._QUEUE_SIZE)
 
     def _load_ipc(self):
         """
@@ -92,59 +146,132 @@ class CorpusIndexer():
         of IPC scheme titles mapped to terms associated with that labels description.
         original file was obtained from:
         http://www.wipo.int/ipc/itos4ipc/ITSupport_and_download_area/20160101/IPC_scheme_title_list/EN_ipc_title_list_20160101.zip
+        It is converted once into a memory mapped IpcTable in IPC.bin which the workers share.
         """
-        with open("IPC.txt",'rb') as dict_file:
-            self._ipc = cPickle.load(dict_file)
-        dict_file.close()
+        self._ipc = parsers.IpcTable.load("IPC.txt", "IPC.bin")
 
     def _start_workers(self):
         """
         Starts the worker processes.
         """
         self._load_ipc()
-        self._event.set()
-        self._workers = [CorpusParser(self._event, self._tasks, self._results, self._ipc) for x in xrange(self._NUM_WORKERS)]
+        self._workers = [CorpusParser(self._tasks, self._results, self._ipc, self._tagger) for x in xrange(self._NUM_WORKERS)]
         [worker.start() for worker in self._workers]
 
-    def _process_result(self, file_name, counter, lnc_scores, raw_terms, ipc_list):
+    def _queue_tasks(self, path_name, files):
         """
-        takes the result from the SearchWorkers, and adds them into
-        a dictionary appropriately formatted to be later serialized.
+        Feeds the corpus files to the workers in chunks, followed by one shutdown
+        sentinel per worker. Runs in its own thread as the bounded task queue
+        blocks until the workers catch up.
         """
-        for term in counter:
-            self.index[term]["dfreq"] += 1
-            self.postings[term]["tfreq"].append(lnc_scores[term])
-            self.postings[term]["docid"].append(file_name)
-        for term in raw_terms:
-            if term not in self.lookup:
-                self.lookup[len(self.lookup)] = term
-            self.docs[file_name].append(len(self.lookup))
-        [self.docsipc[file_name].append(ipc[1]) for ipc in ipc_list]
+        for start in xrange(0, len(files), self._CHUNK_SIZE):
+            chunk = files[start:start + self._CHUNK_SIZE]
+            self._tasks.put([(file_name, os.path.join(path_name, file_name)) for file_name in chunk])
+        for worker in self._workers:
+            self._tasks.put(None)
+
+    def _consume_results(self):
+        """
+        Merges results into the postings as the workers produce them, until
+        every worker has acknowledged shutdown.
+        """
+        running = len(self._workers)
+        while running > 0:
+            try:
+                result = self._results.get(timeout=self._POLL_TIMEOUT)
+            except Queue.Empty:
+                if any(worker.exitcode not in (None, 0) for worker in self._workers):
+                    raise RuntimeError("CorpusParser worker exited unexpectedly")
+                continue
+            if result is None:
+                running -= 1
+            else:
+                self._process_result(result)
+
+    def _process_result(self, batch):
+        """
+        takes a batched partial index from the CorpusParsers, and adds its documents
+        into a dictionary appropriately formatted to be later serialized.
+        """
+        offsets, tids, lncs = unpack_array('I', batch["offsets"]), unpack_array('I', batch["tid"]), unpack_array('d', batch["lnc"])
+        roffsets, rtids = unpack_array('I', batch["roffsets"]), unpack_array('I', batch["rtid"])
+        voffsets, vtids, vtfs = unpack_array('I', batch["voffsets"]), unpack_array('I', batch["vtid"]), unpack_array('I', batch["vtf"])
+        terms = batch["terms"]
+        stems = array('I', [intern_term(self.stem_ids, self.stems, term) for term in terms])
+        rterms = array('I', [intern_term(self.term_ids, self.lookup, term) for term in batch["rterms"]])
+        for n, file_name in enumerate(batch["docid"]):
+            for tid, lnc_score in itertools.izip(tids[offsets[n]:offsets[n + 1]], lncs[offsets[n]:offsets[n + 1]]):
+                term = terms[tid]
+                self.index[term]["dfreq"] += 1
+                self.postings[term]["tfreq"].append(lnc_score)
+                self.postings[term]["docid"].append(file_name)
+            self.docs[file_name] = array('I', [rterms[tid] for tid in rtids[roffsets[n]:roffsets[n + 1]]])
+            self.vectors[file_name] = array('I', [stems[tid] for tid in vtids[voffsets[n]:voffsets[n + 1]]])
+            self.vector_tfs[file_name] = vtfs[voffsets[n]:voffsets[n + 1]]
+            self.docsipc[file_name].extend(batch["ipc"][n])
+        for (stem, tag), count in batch["tags"].iteritems():
+            self.tags[stem][tag] += count
+
+    def _invert_ipc(self):
+        """
+        builds the inverted index of ipc labels to the sorted list of
+        docids having that label.
+        """
+        ipc_docs = defaultdict(set)
+        for docid, ipc_list in self.docsipc.iteritems():
+            for ipc in ipc_list:
+                ipc_docs[ipc].add(docid)
+        return {ipc: sorted(docids) for ipc, docids in ipc_docs.iteritems()}
 
     def index_files(self, path_name):
         """
         Indexes all the corpus files in the provided path.
         returns a dictionary and postings dictionary variables.
         """
-        self._results = multiprocessing.Queue()
         self._start_workers()
         self.index = defaultdict(lambda: {"dfreq": 0})
         self.docsipc = defaultdict(lambda: [])
-        self.docs = defaultdict(lambda: [])
-        self.lookup = {}
+        self.docs = {}
+        self.lookup = []
+        self.term_ids = {}
+        self.vectors = {}
+        self.vector_tfs = {}
+        self.stems = []
+        self.stem_ids = {}
+        self.tags = defaultdict(Counter)
         self.length = {}
         self.postings = defaultdict(lambda: {"docid": [], "tfreq": []})
         files = sorted(os.listdir(path_name))
-        for file_name in files:
-            full_file_path = os.path.join(path_name, file_name)
-            self._tasks.put((file_name, full_file_path))
-        self._tasks.join()
-        self._event.clear()
-        while not self._results.empty():
-            result = self._results.get()
-            self._process_result(*result)
-        final_index = {"terms": dict(self.index), "total_doc": len(files), "lookup": self.lookup, "docs": { "rterms": dict(self.docs), "ipc": dict(self.docsipc)} }
-        return final_index, self.postings
+        feeder = threading.Thread(target=self._queue_tasks, args=(path_name, files))
+        feeder.daemon = True
+        feeder.start()
+        self._consume_results()
+        feeder.join()
+        [worker.join() for worker in self._workers]
+        final_index = {"terms": dict(self.index), "total_doc": len(files), "lookup": self.lookup, "stems": self.stems,
+                       "docids": sorted(self.docs), "docs": {"ipc": dict(self.docsipc)} }
+        final_index["ipc"] = self._invert_ipc()
+        if self._tagger is not None:
+            final_index["tags"] = {stem: counts.most_common(1)[0][0] for stem, counts in self.tags.iteritems()}
+        return final_index, self.postings, [self.docs, self.vectors, self.vector_tfs]
+
+def intern_term(term_ids, vocabulary, term):
+    """
+    returns the id of a term in a vocabulary, adding the term to the
+    vocabulary list and its term to id map if it is not already present.
+    """
+    try:
+        return term_ids[term]
+    except KeyError:
+        term_ids[term] = len(vocabulary)
+        vocabulary.append(term)
+        return term_ids[term]
+
+def unpack_array(typecode, data):
+    """rebuilds an array of the given typecode from its raw bytes"""
+    result = array(typecode)
+    result.fromstring(data)
+    return result
 
 def write_postings(index, postings, postings_filename):
     """
@@ -162,6 +289,27 @@ def write_postings(index, postings, postings_filename):
             postings_file.write(tfreq)
     postings_file.close()
 
+def write_forward_index(index, fields, forward_filename, index_filename):
+    """
+    This method writes the forward index, per document arrays of term ids and frequencies, to the provided
+    filename and records its location relative to the dictionary in the index. The file starts
+    with a header of the number of documents and fields, and every field is stored as an offsets
+    table with an entry per document in the order of index["docids"] followed by the packed arrays.
+    """
+    docids = index["docids"]
+    with open(forward_filename, "wb") as forward_file:
+        forward_file.write(struct.pack("<4sII", "FWDX", len(docids), len(fields)))
+        for field in fields:
+            offsets = array('I', [0])
+            for docid in docids:
+                offsets.append(offsets[-1] + len(field.get(docid, ())))
+            offsets.tofile(forward_file)
+            for docid in docids:
+                field.get(docid, array('I')).tofile(forward_file)
+    forward_file.close()
+    index_dir = os.path.dirname(os.path.abspath(index_filename))
+    index["forward"] = os.path.relpath(os.path.abspath(forward_filename), index_dir)
+
 def write_index(index, index_filename):
     """This method writes the index dictionary to the provided filename"""
     with open(index_filename, 'wb') as dict_file:
@@ -177,9 +325,14 @@ if __name__ == "__main__":
     parser.add_argument("-d", required=True, help="dictionary-file", metavar="dict", dest="dict")
     parser.add_argument("-p", required=True, help="postings-file", metavar="postings", dest="postings")
 
+    # optional arguments
+    parser.add_argument("-f", default="forward.txt", help="forward-index-file", metavar="forward", dest="forward")
+    parser.add_argument("-t", choices=["nltk"], help="precompute part of speech tags with the given tagger", dest="tagger")
+
     args = parser.parse_args()
-    ci = CorpusIndexer()
-    index, postings = ci.index_files(args.train)
+    ci = CorpusIndexer(args.tagger)
+    index, postings, fields = ci.index_files(args.train)
 
     write_postings(index, postings, args.postings)
+    write_forward_index(index, fields, args.forward, args.dict)
     write_index(index, args.dict)
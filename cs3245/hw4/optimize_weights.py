@@ -6,68 +6,317 @@ Email:  a0112937@u.nus.edu
 
 This script was used to find optimal weights for the 5 part of speech tag labels.
 The weights are used in the cosine similarity calculation between query and
-document. As this script was used on an ad hoc basis, arguments pointing towards
-the training set are hardcoded. Don't expect it too be too robust.
+document. The training queries default to the ones the script was first used with,
+and the qrels of a query q.xml are read from q-qrels+ve.txt and q-qrels-ve.txt.
+
+Every optimizer works against the same FitnessEvaluator, with evaluations being the
+expensive unit. The optimizers are
+ - OptimizeWeights, the original genetic algorithm using tournament selection
+ - CmaEs, the covariance matrix adaptation evolution strategy
+ - CoordinateAscent, a line search over one weight at a time with a shrinking step
+ - SuccessiveHalving, random candidates evaluated on a growing subset of the queries,
+   keeping the better half at every round
+The optimizers other than the genetic algorithm maximize the number of correct minus
+incorrect documents retrieved.
+
+Only the 5 weights change between searches, so the similarity of every document is
+split once per query into its partial sums per part of speech category. Evaluating
+a whole population is then a matrix multiplication of those partial sums with the
+population's weights, followed by culling and counting against the qrels.
+
+Fitness is memoized on the weights rounded to a fixed precision, so only new offspring
+and individuals identical to no previous one are evaluated every generation.
+
+Long runs can be checkpointed every few generations and resumed, and seeded to be reproducible.
+Checkpoints are only written when a checkpoint file is given with -c.
+
+usage is as follows:
+
+$ python optimize_weights.py [-d dictionary-file] [-p postings-file] [-q query-file ...] [-m ga|cmaes|coordinate|halving]
+                             [-n evaluations] [-g generations] [-s seed] [-c checkpoint-file] [-i checkpoint-interval] [--resume]
+                             [--population size] [--culling fraction] [--mutation-rate rate]
 
 """
 
+import os
+import math
 import search
-import subprocess
-import sys
 import random
-import multiprocessing
-from collections import Counter
-from fractions import Fraction
-from Queue import Queue
+import cPickle
+import argparse
+import numpy as np
+
+class FitnessEvaluator(object):
+    """
+    Evaluates the fitness of weight vectors, the number of correct and incorrect documents
+    retrieved over the training queries by a search without query expansion.
+    """
+
+    _LABELS = ["VERB", "ADVERB", "NOUN", "ADJECTIVE", "OTHER"]
+    _CHUNK_ELEMENTS = 1 << 22 # bound on the size of a docs x weights score matrix
+
+    def __init__(self, ps, queries, correct, incorrect):
+        """
+        ps is the PatentSearch instance to search with, queries the list of parsed
+        queries as (terms, tagmap) and correct and incorrect the sets of docids
+        of each query's qrels.
+        """
+        self._ps = ps
+        self.evaluations = 0 # weight vectors evaluated, in full query set equivalents
+        self._queries = [self._precompute(terms, tagmap, correct_docs, incorrect_docs)
+                         for (terms, tagmap), correct_docs, incorrect_docs in zip(queries, correct, incorrect)]
+
+    def _precompute(self, terms, tagmap, correct, incorrect):
+        """
+        Calls private methods of PatentSearch directly to compute, for every document
+        retrieved by the query, the partial similarity sums of the query terms in each
+        part of speech category. Returns them as a docs x 5 matrix, along with 0/1
+        vectors of which documents are correct and incorrect. Without tags the weights
+        have no effect, which is represented by summing all terms in every category.
+        """
+        query_tfidfs = self._ps._calculate_query_tfidf(terms)
+        doc_tfidfs = self._ps._retrieve_doc_tfidf(terms)
+        docids = doc_tfidfs.keys()
+        partials = np.zeros((len(docids), len(self._LABELS)))
+        categories = {label: n for n, label in enumerate(self._LABELS)}
+        for row, docid in enumerate(docids):
+            for term, weight in doc_tfidfs[docid].iteritems():
+                if tagmap:
+                    partials[row, categories[tagmap.get(term, "OTHER")]] += query_tfidfs[term] * weight
+                else:
+                    partials[row, :] += query_tfidfs[term] * weight
+        is_correct = np.array([docid in correct for docid in docids], dtype=int)
+        is_incorrect = np.array([docid in incorrect for docid in docids], dtype=int)
+        return partials, bool(tagmap), is_correct, is_incorrect
+
+    @property
+    def num_queries(self):
+        """number of training queries"""
+        return len(self._queries)
+
+    def evaluate(self, population, queries=None):
+        """
+        returns arrays of the number of correct and incorrect documents retrieved
+        over all queries, or the given list of query indices, for every weight
+        vector in the population.
+        """
+        if queries is None:
+            queries = xrange(len(self._queries))
+        queries = list(queries)
+        weights = np.asarray(population, dtype=float)
+        self.evaluations += len(weights) * len(queries) / float(len(self._queries))
+        pos = np.zeros(len(weights), dtype=int)
+        neg = np.zeros(len(weights), dtype=int)
+        for partials, tagged, is_correct, is_incorrect in (self._queries[query] for query in queries):
+            if len(partials) == 0:
+                continue
+            if not tagged: # every weight vector scores as if all weights were 1
+                weights_used = np.full((len(weights), len(self._LABELS)), 1.0 / len(self._LABELS))
+            else:
+                weights_used = weights
+            chunk = max(1, self._CHUNK_ELEMENTS // len(partials))
+            for start in xrange(0, len(weights), chunk):
+                scores = partials.dot(weights_used[start:start + chunk].T)
+                # cull documents scoring below the average of their column by the cull cutoff of PatentSearch
+                retrieved = scores > scores.mean(axis=0) / self._ps._CULL_CUTOFF
+                pos[start:start + chunk] += is_correct.dot(retrieved)
+                neg[start:start + chunk] += is_incorrect.dot(retrieved)
+        return pos, neg
+
+def read_training_set(ps, query_filenames):
+    """
+    parses the training queries and reads the sets of correct and
+    incorrect docids of each from its qrels files.
+    """
+    queries, correct, incorrect = [], [], []
+    for query_filename in query_filenames:
+        base = os.path.splitext(query_filename)[0]
+        queries.append(ps._parse_query(query_filename))
+        correct.append(set(open(base + "-qrels+ve.txt").read().split()))
+        incorrect.append(set(open(base + "-qrels-ve.txt").read().split()))
+    return queries, correct, incorrect
+
+def positive_int(value):
+    """argparse type of an integer of at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("%s is not a positive integer" % value)
+    return number
+
+class Optimizer(object):
+    """
+    Base class of the optimizers other than the genetic algorithm. Keeps track of
+    the best weights found, by the number of correct minus incorrect documents retrieved.
+    Subclasses implement optimize, which runs until the evaluator has spent the budget.
+    """
+
+    num_weights = 5
+
+    def __init__(self, evaluator, seed=None):
+        """evaluator is the FitnessEvaluator, seed seeds the random number generator"""
+        self._evaluator = evaluator
+        self._random = np.random.RandomState(seed)
+        self.best_weights = None
+        self.best_fitness = None
+
+    def _normalize(self, weights):
+        """normalize the absolute values of every row of weights to sum to 1"""
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+        sums = np.abs(weights).sum(axis=1)[:, np.newaxis]
+        return np.where(sums > 0, weights / np.where(sums > 0, sums, 1), 1.0 / self.num_weights)
+
+    def _fitness(self, population, queries=None):
+        """returns the fitness of every weight vector, updating the best found on all queries"""
+        population = self._normalize(population)
+        pos, neg = self._evaluator.evaluate(population, queries)
+        fitness = pos - neg
+        if queries is None:
+            best = int(np.argmax(fitness))
+            if self.best_fitness is None or fitness[best] > self.best_fitness:
+                self.best_fitness = int(fitness[best])
+                self.best_weights = population[best].tolist()
+        return fitness
+
+    def _spent(self, budget):
+        """whether the evaluation budget is used up"""
+        return self._evaluator.evaluations >= budget
+
+    def report(self):
+        """prints the best weights found, if any were evaluated on all queries"""
+        if self.best_weights is None:
+            print "No weights were evaluated on all queries"
+            return
+        pos, neg = self._evaluator.evaluate([self.best_weights])
+        print "Pos: %s, Neg: %s, Weights: %s" % (pos[0], neg[0], self.best_weights)
+        print "Evaluations: %.1f" % self._evaluator.evaluations
 
-class SearchWorker(multiprocessing.Process):
+class CmaEs(Optimizer):
     """
-    Each worker instance has its own patent search instance
-    and all the instances will handle performing the search query
-    by consuming the queue containing weights to be used for the query.
+    Covariance matrix adaptation evolution strategy with the default population size,
+    rank-mu and rank-one covariance updates and cumulative step size adaptation.
     """
-    
-    def __init__(self, event, queue, results):
-        """
-        initializes a new SearchWorker instance with its own patent search instance.
-        reads the files for correct and incorrect queries to be used later.
-        """
-        multiprocessing.Process.__init__(self)
-        self._event = event
-        self._queue = queue
-        self._results = results
-        self._ps = search.PatentSearch("dictionary.txt", "postings.txt")
-        self._queries = [self._ps._parse_query("cs3245-hw4\\q1.xml"), self._ps._parse_query("cs3245-hw4\\q2.xml")]
-        self._correct = [set(open("cs3245-hw4\\q1-qrels+ve.txt").read().split()), set(open("cs3245-hw4\\q2-qrels+ve.txt").read().split())]
-        self._incorrect = [set(open("cs3245-hw4\\q1-qrels-ve.txt").read().split()), set(open("cs3245-hw4\\q2-qrels-ve.txt").read().split())]
-        self.daemon = True
-
-    def _do_search(self, weights):
-        """
-        Performs the search task. Calls private methods directly instead of relying of public methods
-        as we optimize for search without query expansion due to time complexity involved.
-        """
-        pos = 0
-        neg = 0
-        weights = {label: weight for label, weight in zip(["VERB", "ADVERB", "NOUN", "ADJECTIVE", "OTHER"], weights)}
-        for ((terms, tagmap), correct, incorrect) in zip(self._queries, self._correct, self._incorrect):
-            query_tfidfs = self._ps._calculate_query_tfidf(terms)
-            doc_tfidfs = self._ps._retrieve_doc_tfidf(terms)
-            similarities = self._ps._calculate_similarity(query_tfidfs, doc_tfidfs, tagmap, weights)
-            results = self._ps._cull_results(similarities)
-            results = set(self._ps._rank_results(results, similarities))
-            pos += len(results & correct)
-            neg += len(results & incorrect)
-        return (pos, neg)
-
-    def run(self):
-        """run method"""
-        self._ps.index._reopen_postings_file()
-        while self._event.is_set():
-            index, weights = self._queue.get()
-            result = self._do_search(weights)
-            self._results.put((index, result))
-            self._queue.task_done()
+
+    initial_sigma = 0.3
+
+    def optimize(self, budget):
+        """runs generations of the evolution strategy until the budget is spent"""
+        n = self.num_weights
+        lam = 4 + int(3 * math.log(n))
+        mu = lam // 2
+        recombination = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        recombination /= recombination.sum()
+        mueff = 1 / (recombination ** 2).sum()
+        cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+        cs = (mueff + 2) / (n + mueff + 5)
+        c1 = 2 / ((n + 1.3) ** 2 + mueff)
+        cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2) ** 2 + mueff))
+        damps = 1 + 2 * max(0, math.sqrt((mueff - 1) / (n + 1)) - 1) + cs
+        chi_n = math.sqrt(n) * (1 - 1.0 / (4 * n) + 1.0 / (21 * n ** 2))
+        mean = self._normalize(self._random.uniform(-1, 1, n))[0]
+        sigma = self.initial_sigma
+        covariance, pc, ps = np.eye(n), np.zeros(n), np.zeros(n)
+        generation = 0
+        while not self._spent(budget):
+            eigenvalues, basis = np.linalg.eigh(covariance)
+            scales = np.sqrt(np.maximum(eigenvalues, 1e-20))
+            steps = self._random.standard_normal((lam, n)).dot((basis * scales).T)
+            candidates = mean + sigma * steps
+            fitness = self._fitness(candidates)
+            order = np.argsort(-fitness)[:mu]
+            step = recombination.dot(steps[order])
+            mean = mean + sigma * step
+            inverse_sqrt = basis.dot(np.diag(1 / scales)).dot(basis.T)
+            ps = (1 - cs) * ps + math.sqrt(cs * (2 - cs) * mueff) * inverse_sqrt.dot(step)
+            generation += 1
+            hsig = np.linalg.norm(ps) / math.sqrt(1 - (1 - cs) ** (2 * generation)) / chi_n < 1.4 + 2.0 / (n + 1)
+            pc = (1 - cc) * pc + hsig * math.sqrt(cc * (2 - cc) * mueff) * step
+            covariance = ((1 - c1 - cmu) * covariance
+                          + c1 * (np.outer(pc, pc) + (1 - hsig) * cc * (2 - cc) * covariance)
+                          + cmu * (steps[order].T * recombination).dot(steps[order]))
+            sigma *= math.exp((cs / damps) * (np.linalg.norm(ps) / chi_n - 1))
+            # the fitness is scale invariant, so keep the mean on the normalized scale
+            scale = np.abs(mean).sum()
+            if scale > 0:
+                mean, sigma = mean / scale, sigma / scale
+            print " Generation: %s, Best: %s, Sigma: %.4f" % (generation, self.best_fitness, sigma)
+
+class CoordinateAscent(Optimizer):
+    """
+    Line search over one weight at a time. Every weight is tried at a number of
+    offsets from its current value in a single batch, moving to the best if it improves.
+    The step is halved after a pass over all weights without improvement.
+    """
+
+    initial_step = 0.5
+    min_step = 1e-3
+    num_offsets = 8
+
+    def optimize(self, budget, initial=None):
+        """runs passes over the weights until the budget is spent or the step is too small"""
+        current = self._normalize(initial if initial is not None else self._random.uniform(-1, 1, self.num_weights))[0]
+        current_fitness = self._fitness([current])[0]
+        step = self.initial_step
+        offsets = np.linspace(-1, 1, self.num_offsets)
+        while not self._spent(budget) and step >= self.min_step:
+            improved = False
+            for weight in xrange(self.num_weights):
+                candidates = np.tile(current, (self.num_offsets, 1))
+                candidates[:, weight] += step * offsets
+                candidates = self._normalize(candidates)
+                fitness = self._fitness(candidates)
+                best = int(np.argmax(fitness))
+                if fitness[best] > current_fitness:
+                    current, current_fitness, improved = candidates[best], fitness[best], True
+            if not improved:
+                step /= 2
+            print " Step: %.4f, Best: %s" % (step, self.best_fitness)
+
+class SuccessiveHalving(Optimizer):
+    """
+    Samples random candidates and evaluates them on a growing number of the queries,
+    keeping the better half each round, so most candidates are discarded after being
+    evaluated on a few queries only. Rounds repeat with fresh candidates until the budget is spent.
+    """
+
+    num_candidates = 256
+
+    def _schedule(self, num_candidates, num_queries):
+        """
+        yields the number of candidates kept and of queries they are evaluated on for every
+        rung of a round, a single candidate left is evaluated on all the queries at once.
+        """
+        rungs = max(1, int(math.ceil(math.log(num_queries, 2))) + 1)
+        for rung in xrange(rungs):
+            used = num_queries if num_candidates == 1 else min(num_queries, int(math.ceil(num_queries * 2.0 ** (rung + 1 - rungs))))
+            yield num_candidates, used
+            if used == num_queries:
+                break
+            num_candidates = max(1, num_candidates // 2)
+
+    def _cost(self, num_candidates, num_queries):
+        """returns the evaluations a round of num_candidates uses"""
+        return sum(size * used / float(num_queries) for size, used in self._schedule(num_candidates, num_queries))
+
+    def optimize(self, budget):
+        """
+        runs rounds of successive halving until the budget is spent, a round that does not fit
+        in the rest of the budget is run with fewer candidates, and none is run if even one does not fit.
+        """
+        num_queries = self._evaluator.num_queries
+        while not self._spent(budget):
+            remaining = budget - self._evaluator.evaluations
+            num_candidates = self.num_candidates
+            while num_candidates > 1 and self._cost(num_candidates, num_queries) > remaining:
+                num_candidates -= 1
+            if self._cost(num_candidates, num_queries) > remaining:
+                break
+            candidates = self._normalize(self._random.uniform(-1, 1, (num_candidates, self.num_weights)))
+            for size, used in self._schedule(num_candidates, num_queries):
+                if size < len(candidates):
+                    candidates = candidates[np.argsort(-fitness)[:size]]
+                queries = None if used == num_queries else self._random.choice(num_queries, used, replace=False)
+                fitness = self._fitness(candidates, queries)
+            print " Round Best: %s, Evaluations: %.1f" % (self.best_fitness, self._evaluator.evaluations)
 
 class OptimizeWeights():
     """
@@ -75,34 +324,30 @@ class OptimizeWeights():
     on part of speech tagging category.
     """
 
-    _NUM_WORKERS = multiprocessing.cpu_count()
     population_size = 10000 # number of agents
     selection = 0.1 # random pool size to select best parents from
     culling = 0.3 # % of population to cull and replace every generation
     mutation_rate = 0.1 # mutation rate
     mutation_delta = 0.2 # % range of mutation adjustment
     num_weights = 5 
+    cache_precision = 9 # decimal places weights are rounded to for fitness memoization
 
-    def __init__(self):
+    def __init__(self, evaluator, seed=None, population_size=None, culling=None, mutation_rate=None):
         """
-        initializes the multiprocessing data structures and spawn workers
+        evaluator is the FitnessEvaluator of the training queries. seeds the random number
+        generator and the population, the class defaults are used for parameters left as None.
         """
-        self._event = multiprocessing.Event()
-        self._queue = multiprocessing.JoinableQueue()
-        self._results = multiprocessing.Queue()
-        self._spawn_workers()
+        random.seed(seed)
+        self._fitness_cache = {}
+        self._evaluator = evaluator
+        if population_size is not None:
+            self.population_size = population_size
+        if culling is not None:
+            self.culling = culling
+        if mutation_rate is not None:
+            self.mutation_rate = mutation_rate
         self.population = self._seed_population()
 
-    def _spawn_workers(self):
-        """spawns the threaded worker class instances"""
-        self._event.set()
-        self._workers = [SearchWorker(self._event, self._queue, self._results) for x in xrange(self._NUM_WORKERS)]
-        [worker.start() for worker in self._workers]
-
-    def _queue_search(self, population):
-        """puts the work into the queue for the worker instances to consume"""
-        map(self._queue.put, enumerate(population))
-
     def _normalize(self, weights):
         """normalize values to 1. if all weights are 0 return 0.5 (for crossover average weighted fitness)"""
         sum_weights = sum(map(abs, weights))
@@ -155,27 +400,112 @@ class OptimizeWeights():
             print "Pos: %s, Neg: %s, Weights: %s" % (self._scores[idx][0], self._scores[idx][1], self.population[idx])
         print "Population Average Pos: %.1f, Neg: %.1f" % (self._total_pos / float(self.population_size), self._total_neg / float(self.population_size))
 
-    def optimize_weights(self, generations):
+    def _evaluate(self, population):
+        """
+        returns arrays of the correct and incorrect document counts of the population.
+        Only weights missing from the fitness cache are evaluated, each distinct one
+        once, and the number of cache hits is returned too.
+        """
+        keys = [tuple(round(w, self.cache_precision) for w in weights) for weights in population]
+        missing = {}
+        for key, weights in zip(keys, population):
+            if key not in self._fitness_cache and key not in missing:
+                missing[key] = weights
+        if missing:
+            pos, neg = self._evaluator.evaluate(missing.values())
+            for key, p, n in zip(missing.keys(), pos, neg):
+                self._fitness_cache[key] = (int(p), int(n))
+        scores = np.array([self._fitness_cache[key] for key in keys], dtype=int).reshape(-1, 2)
+        return scores[:, 0], scores[:, 1], len(keys) - len(missing)
+
+    def save_checkpoint(self, checkpoint_filename, generation):
+        """
+        saves the population, the scores of the last evaluated generation, the random
+        number generator state and the number of the next generation to the checkpoint file.
+        The population and scores are stored as arrays in pickle's binary protocol. The file
+        is replaced atomically so a run killed while saving leaves the previous checkpoint intact.
+        """
+        scores = getattr(self, "_scores", {})
+        checkpoint = {"generation": generation,
+                      "population": np.asarray(self.population, dtype=float),
+                      "scores": np.array([scores[idx] for idx in sorted(scores)], dtype=np.int32).reshape(-1, 2),
+                      "random_state": random.getstate()}
+        temp_filename = checkpoint_filename + ".tmp"
+        with open(temp_filename, 'wb') as checkpoint_file:
+            cPickle.dump(checkpoint, checkpoint_file, cPickle.HIGHEST_PROTOCOL)
+        checkpoint_file.close()
+        os.rename(temp_filename, checkpoint_filename)
+
+    def load_checkpoint(self, checkpoint_filename):
+        """
+        restores the state saved by save_checkpoint, returning the number of
+        the generation to resume from.
+        """
+        with open(checkpoint_filename, 'rb') as checkpoint_file:
+            checkpoint = cPickle.load(checkpoint_file)
+        checkpoint_file.close()
+        self.population = checkpoint["population"].tolist()
+        self.population_size = len(self.population)
+        self._scores = {idx: (int(pos), int(neg)) for idx, (pos, neg) in enumerate(checkpoint["scores"])}
+        random.setstate(checkpoint["random_state"])
+        return checkpoint["generation"]
+
+    def optimize_weights(self, generations, checkpoint_filename=None, interval=1, start=0):
         """
-        feeds the worker instances weights created every new generation
-        and then consumes the results once all the workers have completed.
+        evaluates the population created every new generation in one batch
+        and then ranks them to create the next generation. If a checkpoint file is
+        given the state is saved to it every interval generations and after the last.
         """
-        for gen in xrange(generations):
+        if interval < 1:
+            raise ValueError("checkpoint interval must be at least 1")
+        for gen in xrange(start, generations):
             print " Generation: %s" % gen
-            self._total_pos = 0
-            self._total_neg = 0
-            self._queue_search(self.population)
-            self._queue.join()
-            self._scores = {}
-            while not self._results.empty():
-                (index, (pos, neg)) = self._results.get()
-                self._scores[index] = (pos, neg)
-                self._total_pos += pos
-                self._total_neg += neg
+            pos, neg, hits = self._evaluate(self.population)
+            print "Fitness cache hits: %s/%s (%.1f%%)" % (hits, self.population_size, 100.0 * hits / self.population_size)
+            self._scores = {index: (int(p), int(n)) for index, (p, n) in enumerate(zip(pos, neg))}
+            self._total_pos = int(pos.sum())
+            self._total_neg = int(neg.sum())
             ranks = sorted(xrange(self.population_size), key=lambda s: (self._scores.get(s)[0], self._scores.get(s)[1]))
             self._report(ranks)
             self._next_generation(ranks)
+            if checkpoint_filename is not None and ((gen + 1 - start) % interval == 0 or gen + 1 == generations):
+                self.save_checkpoint(checkpoint_filename, gen + 1)
 
 if __name__ == '__main__':
-    ow = OptimizeWeights()
-    ow.optimize_weights(100) 
\ No newline at end of file
+
+    parser = argparse.ArgumentParser()
+
+    # optional arguments
+    parser.add_argument("-d", default="dictionary.txt", help="dictionary-file", metavar="dict", dest="dict")
+    parser.add_argument("-p", default="postings.txt", help="postings-file", metavar="postings", dest="postings")
+    parser.add_argument("-q", nargs="+", default=[os.path.join("cs3245-hw4", "q1.xml"), os.path.join("cs3245-hw4", "q2.xml")],
+                        help="training query files", metavar="queries", dest="queries")
+    parser.add_argument("-m", choices=["ga", "cmaes", "coordinate", "halving"], default="ga", help="optimizer", dest="method")
+    parser.add_argument("-n", type=positive_int, default=2000, help="evaluation budget of the optimizers other than ga", metavar="evaluations", dest="budget")
+    parser.add_argument("-g", type=int, default=100, help="number of generations", metavar="generations", dest="generations")
+    parser.add_argument("-s", type=int, help="random seed", metavar="seed", dest="seed")
+    parser.add_argument("-c", help="checkpoint-file, checkpoints are only written when given", metavar="checkpoint", dest="checkpoint")
+    parser.add_argument("-i", type=positive_int, default=1, help="generations between checkpoints", metavar="interval", dest="interval")
+    parser.add_argument("--resume", action="store_true", help="resume from the checkpoint file", dest="resume")
+    parser.add_argument("--population", type=int, help="ga population size", metavar="size", dest="population_size")
+    parser.add_argument("--culling", type=float, help="ga fraction of population replaced every generation", metavar="fraction", dest="culling")
+    parser.add_argument("--mutation-rate", type=float, help="ga mutation rate", metavar="rate", dest="mutation_rate")
+
+    args = parser.parse_args()
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume requires a checkpoint file given with -c")
+
+    ps = search.PatentSearch(args.dict, args.postings)
+    evaluator = FitnessEvaluator(ps, *read_training_set(ps, args.queries))
+    if args.method == "ga":
+        ow = OptimizeWeights(evaluator, args.seed, args.population_size, args.culling, args.mutation_rate)
+        start = 0
+        if args.resume:
+            start = ow.load_checkpoint(args.checkpoint)
+            print "Resuming from generation %s" % start
+        ow.optimize_weights(args.generations, args.checkpoint, args.interval, start)
+    else:
+        optimizers = {"cmaes": CmaEs, "coordinate": CoordinateAscent, "halving": SuccessiveHalving}
+        optimizer = optimizers[args.method](evaluator, args.seed)
+        optimizer.optimize(args.budget)
+        optimizer.report()
\ No newline at end of file
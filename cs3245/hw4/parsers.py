@@ -6,14 +6,24 @@ Email:  a0112937@u.nus.edu
 
 This script contains parsing methods used by both index.py and search.py
 Methods are used to handle tokenizing and processing of text, parsing
-of xml files and expansion of document terms.
+of xml files and expansion of document terms. IpcTable is a compact read only
+form of the IPC label descriptions used for document expansion.
+
+Part of speech tags are simplified into 5 categories. A lexicon of stems to tags precomputed
+with nltk at index time turns tagging into a lookup, and a fast tagger of suffix rules can be
+used in place of nltk for the terms it does not cover.
 
 """
+import os
+import mmap
 import nltk
+import struct
 import cPickle
+from array import array
 from string import ascii_lowercase
 from xml.etree import ElementTree
 from functools import partial
+from collections import Counter
 from nltk import word_tokenize
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
@@ -36,6 +46,137 @@ map(lambda postag: pos_simplify.__setitem__(postag, "ADVERB"), ["RB", "RBR", "RB
 map(lambda postag: pos_simplify.__setitem__(postag, "NOUN"), ["NN", "NNP", "NNPS", "NNS"])
 map(lambda postag: pos_simplify.__setitem__(postag, "ADJECTIVE"), ["JJ", "JJR", "JJS"])
 
+# suffix rules of the fast tagger, checked in order
+suffix_tags = [("ly", "ADVERB"), ("ward", "ADVERB"), ("wise", "ADVERB"),
+               ("ous", "ADJECTIVE"), ("ive", "ADJECTIVE"), ("able", "ADJECTIVE"), ("ible", "ADJECTIVE"),
+               ("ful", "ADJECTIVE"), ("less", "ADJECTIVE"), ("ic", "ADJECTIVE"), ("al", "ADJECTIVE"),
+               ("ing", "VERB"), ("ed", "VERB"), ("ize", "VERB"), ("ise", "VERB"), ("ate", "VERB"), ("en", "VERB")]
+
+# stems of tokens seen so far
+stem_cache = {}
+
+class IpcTable(object):
+    """
+    Read only table of IPC labels mapped to the terms of their description, stored
+    in a binary file that is memory mapped, so that worker processes share a single
+    copy of it. The file holds a header, the sorted label names and the term vocabulary
+    as strings delimited by offsets arrays, an offsets array with an entry per label and
+    the flat array of term ids of every label delimited by those offsets. Labels are
+    found by a binary search and terms are read from the map, so no per process copy
+    of the labels or vocabulary is ever built.
+    """
+
+    _MAGIC = "IPC2"
+    _HEADER = struct.Struct("<4sIIII")
+    _ENTRY = struct.Struct("I") # an entry of an offsets array, written as array('I')
+
+    def __init__(self, table_filename):
+        """table_filename refers to a file written by IpcTable.build"""
+        with open(table_filename, "rb") as table_file:
+            self._map = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        table_file.close()
+        if len(self._map) < self._HEADER.size or self._map[:4] != self._MAGIC:
+            raise ValueError("%s is not an IPC table" % table_filename)
+        magic, self.num_terms, self.num_labels, labels_size, vocab_size = self._HEADER.unpack_from(self._map)
+        self._label_offsets = self._HEADER.size
+        self._labels = self._label_offsets + 4 * (self.num_labels + 1)
+        self._vocab_offsets = self._labels + labels_size
+        self._vocab = self._vocab_offsets + 4 * (self.num_terms + 1)
+        self._offsets = self._vocab + vocab_size
+        self._ids = self._offsets + 4 * (self.num_labels + 1)
+
+    @classmethod
+    def build(cls, ipc, table_filename):
+        """
+        writes the dictionary of ipc labels to lists of terms into the
+        binary table format.
+        """
+        vocabulary, term_ids = [], {}
+        offsets, ids = array('I', [0]), array('I')
+        labels = sorted(ipc.keys())
+        for label in labels:
+            for term in ipc[label]:
+                if term not in term_ids:
+                    term_ids[term] = len(vocabulary)
+                    vocabulary.append(term)
+                ids.append(term_ids[term])
+            offsets.append(len(ids))
+        label_offsets, vocab_offsets = cls._string_offsets(labels), cls._string_offsets(vocabulary)
+        labels_blob, vocab_blob = "".join(labels), "".join(vocabulary)
+        with open(table_filename, "wb") as table_file:
+            table_file.write(cls._HEADER.pack(cls._MAGIC, len(vocabulary), len(labels), len(labels_blob), len(vocab_blob)))
+            label_offsets.tofile(table_file)
+            table_file.write(labels_blob)
+            vocab_offsets.tofile(table_file)
+            table_file.write(vocab_blob)
+            offsets.tofile(table_file)
+            ids.tofile(table_file)
+        table_file.close()
+
+    @staticmethod
+    def _string_offsets(strings):
+        """returns the offsets array delimiting a list of strings once they are joined"""
+        offsets = array('I', [0])
+        for string in strings:
+            offsets.append(offsets[-1] + len(string))
+        return offsets
+
+    @classmethod
+    def load(cls, ipc_filename, table_filename):
+        """
+        loads the table, rebuilding it first from the pickled ipc dictionary
+        if it does not exist, is older than the dictionary or is in an older format.
+        """
+        if os.path.exists(table_filename) and os.path.getmtime(table_filename) >= os.path.getmtime(ipc_filename):
+            try:
+                return cls(table_filename)
+            except ValueError:
+                pass
+        with open(ipc_filename, 'rb') as dict_file:
+            ipc = cPickle.load(dict_file)
+        dict_file.close()
+        cls.build(ipc, table_filename)
+        return cls(table_filename)
+
+    def _entry(self, table, n):
+        """returns entry n of the offsets array at position table of the map"""
+        return self._ENTRY.unpack_from(self._map, table + 4 * n)[0]
+
+    def _string(self, table, strings, n):
+        """returns string n of the strings at position strings delimited by the offsets array at position table"""
+        return self._map[strings + self._entry(table, n):strings + self._entry(table, n + 1)]
+
+    def _find(self, label):
+        """returns the number of a label by binary search of the sorted labels, or None for unknown labels"""
+        low, high = 0, self.num_labels
+        while low < high:
+            mid = (low + high) // 2
+            if self._string(self._label_offsets, self._labels, mid) < label:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.num_labels and self._string(self._label_offsets, self._labels, low) == label:
+            return low
+        return None
+
+    def term(self, term_id):
+        """returns the term of a term id"""
+        return self._string(self._vocab_offsets, self._vocab, term_id)
+
+    def term_ids(self, label):
+        """returns the array of term ids describing a label, or None for unknown labels"""
+        n = self._find(label)
+        if n is None:
+            return None
+        return array('I', self._map[self._ids + 4 * self._entry(self._offsets, n):self._ids + 4 * self._entry(self._offsets, n + 1)])
+
+    def get(self, label, default=None):
+        """returns the list of terms describing a label"""
+        term_ids = self.term_ids(label)
+        if term_ids is None:
+            return default
+        return map(self.term, term_ids)
+
 def remove_numerals(term, result):
     """
     remove all numerals from a list of strings
@@ -56,22 +197,26 @@ def tokenize_text(text):
     map(partial(remove_numerals, result=tokenized_text), text)
     return tokenized_text
 
-def process_text(tokenized_text, postag=False):
+def stem_term(term):
+    """stems a term, caching the result as the same terms recur constantly"""
+    try:
+        return stem_cache[term]
+    except KeyError:
+        stem_cache[term] = stemmer.stem_word(term)
+        return stem_cache[term]
+
+def process_text(tokenized_text, postag=False, lexicon=None, fast=False):
     """
     processes a list of tokenized terms into stemmed form and 
     remove unwanted terms. If postag is True return the map of 
-    term to part of speech tag.
+    term to part of speech tag, see get_pos_tags for lexicon and fast.
     """
     tagmap = {}
-    try:
-        if postag:
-            tagmap = get_pos_tags(tokenized_text)
-    except LookupError:
-        print "WARNING: POS TAGGER NOT INSTALLED"
-        print "OPERATING AT REDUCED PERFORMANCE"
+    if postag:
+        tagmap = pos_tags(tokenized_text, lexicon, fast)
     try:
         #tokenized_text = map(lemmatizer.lemmatize, tokenized_text)
-        tokenized_text = map(stemmer.stem_word, tokenized_text)
+        tokenized_text = map(stem_term, tokenized_text)
         tokenized_text = filter(lambda term: term not in general_terms, tokenized_text)
         return (tokenized_text, tagmap)
     except Exception, e:
@@ -113,11 +258,13 @@ def parse_corpus_ipc(ipc_string):
         ipc_group_b = ipc_string[break_pos+1:]
     return (ipc_class, ipc_subclass, ipc_group_a, ipc_group_b)
 
-def expand_terms(ipc, terms, ipc_list):
+def expand_terms(ipc, term_counts, ipc_list):
     """
     performs document expansion.
     Documents are expanded by adding terms retrieved from its associated
-    IPC Scheme label description.
+    IPC Scheme label description. The term ids of every label are counted
+    and each distinct id is looked up once, and a new Counter of the terms
+    of the expanded document is returned.
     """
     labels = []
     for (ipc_class, ipc_subclass, ipc_group_a, ipc_group_b) in ipc_list:
@@ -126,24 +273,66 @@ def expand_terms(ipc, terms, ipc_list):
             ipc_group_b = len(ipc_group_b) == 0 and "0" + ipc_group_b or ipc_group_b
             labels.append(ipc_subclass + "0"*(4-len(ipc_group_a)) + ipc_group_a + "0" * 6) # category level label
             labels.append(ipc_subclass + "0"*(4-len(ipc_group_a)) + ipc_group_a + ipc_group_b + "0"*(6-len(ipc_group_b))) # full label
+    expansion = Counter()
     for label in labels:
-        try:
-            terms.extend(ipc[label])
-        except KeyError:
-            pass
-    return terms
+        term_ids = ipc.term_ids(label)
+        if term_ids is not None:
+            expansion.update(term_ids)
+    counter = Counter(term_counts)
+    for term_id, count in expansion.iteritems():
+        counter[ipc.term(term_id)] += count
+    return counter
+
+def pos_tags(tokenized_text, lexicon=None, fast=False):
+    """
+    retrieves the map of stemmed terms to part of speech tags,
+    or an empty map if the tagger is not installed.
+    """
+    try:
+        return get_pos_tags(tokenized_text, lexicon, fast)
+    except LookupError:
+        print "WARNING: POS TAGGER NOT INSTALLED"
+        print "OPERATING AT REDUCED PERFORMANCE"
+        return {}
 
-def get_pos_tags(tokenized_text):
+def get_pos_tags(tokenized_text, lexicon=None, fast=False):
     """
     retrieves the simplified part of speech tags of terms
-    and returns a map of it.
+    and returns a map of it. Terms whose stem is in the lexicon
+    of stems to tags are looked up instead of tagged, and the rest
+    are tagged by nltk, or by the fast tagger if fast is True.
     """
     tagmap = {}
-    tags = set(nltk.pos_tag(tokenized_text))
-    for term, tag in tags:
-        try:
-            tag = pos_simplify[tag]
-        except KeyError:
-            tag = "OTHER"
-        tagmap[stemmer.stem_word(term)] = tag
-    return tagmap
\ No newline at end of file
+    untagged = []
+    for term in tokenized_text:
+        stem = stem_term(term)
+        if lexicon is not None and stem in lexicon:
+            tagmap[stem] = lexicon[stem]
+        else:
+            untagged.append(term)
+    tags = fast and fast_tag_terms(untagged) or tag_terms(untagged)
+    for term, tag in set(tags):
+        tagmap[stem_term(term)] = tag
+    return tagmap
+
+def tag_terms(tokenized_text):
+    """
+    tags terms with nltk, returning a list of terms and their simplified tags.
+    """
+    if len(tokenized_text) == 0:
+        return []
+    return [(term, pos_simplify.get(tag, "OTHER")) for term, tag in nltk.pos_tag(tokenized_text)]
+
+def fast_tag_terms(tokenized_text):
+    """
+    tags terms by their suffix alone, without running nltk.
+    returns a list of terms and their simplified tags.
+    """
+    return [(term, fast_tag(term)) for term in tokenized_text]
+
+def fast_tag(term):
+    """returns the tag guessed from the suffix of a term, a noun if no rule matches"""
+    for suffix, tag in suffix_tags:
+        if term.endswith(suffix):
+            return tag
+    return "NOUN"
\ No newline at end of file
@@ -4,9 +4,11 @@
 Matric: A0112937E
 Email:  a0112937@u.nus.edu
 
-This script contains 2 classes.
+This script contains 3 classes and 3 helper methods for batch searches.
+ - ForwardIndex provides random access to the per document term id arrays stored in the
+   forward index file written by index.py
  - Index is the data structure that encapsulates the process of handling retrieval from the 
-   dictionary and postings file
+   dictionary, postings and forward index file
  - PatentSearch is the main class which handlings the process of parsing query from
    the provided query file, executing them and saving the output to file.
 
@@ -17,17 +19,29 @@ model of features extracted from the query and performs similarity ranking based
 The top results are then used to perform query expansion, and the search is re performed with
 the new query.
 
+In batch mode, every query file in a directory or listed in a manifest file (one path per line,
+relative to the manifest) is searched against a single loaded index by a pool of worker processes.
+Results are written to one file per query in the output directory, or with -r to a single
+TREC run file.
+
 usage is as follows:
 
-$ python search.py -d dictionary-file -p postings-file -q file-of-queries -o output-file-of-results
+$ python search.py -d dictionary-file -p postings-file -q file-of-queries -o output-file-of-results [-t]
+$ python search.py -d dictionary-file -p postings-file -b query-directory-or-manifest -o output-directory [-r] [-w workers] [-t]
 
 """
+import os
+import sys
+import mmap
 import nltk
+import struct
 import parsers
 import cPickle
+import heapq
 import argparse
 import itertools
 from math import log10
+from array import array
 from fractions import Fraction
 from collections import Counter
 from xml.etree import ElementTree
@@ -35,12 +49,45 @@ from collections import defaultdict
 from nltk.stem.porter import PorterStemmer
 import multiprocessing
 
+class ForwardIndex(object):
+    """
+    This class memory maps the forward index file, which holds for every field an offsets
+    table of one entry per document followed by the packed arrays of the documents.
+    Documents are addressed by their position in the sorted list of docids. The fields are
+    the raw term ids, and the stemmed term ids and term frequencies of the document vector.
+    """
+
+    RAW_TERMS, VECTOR_TERMS, VECTOR_FREQS = 0, 1, 2
+
+    _HEADER = struct.Struct("<4sII")
+
+    def __init__(self, forward_filename):
+        """forward_filename refers to the forward index file"""
+        with open(forward_filename, "rb") as forward_file:
+            self._map = mmap.mmap(forward_file.fileno(), 0, access=mmap.ACCESS_READ)
+        forward_file.close()
+        magic, self.num_docs, num_fields = self._HEADER.unpack_from(self._map)
+        if magic != "FWDX":
+            raise ValueError("%s is not a forward index" % forward_filename)
+        self._fields = []
+        position = self._HEADER.size
+        for field in xrange(num_fields):
+            offsets = array('I', self._map[position:position + 4 * (self.num_docs + 1)])
+            position += 4 * (self.num_docs + 1)
+            self._fields.append((offsets, position))
+            position += 4 * offsets[-1]
+
+    def get(self, field, docnum):
+        """returns the array of a field for the document numbered docnum"""
+        offsets, position = self._fields[field]
+        return array('I', self._map[position + 4 * offsets[docnum]:position + 4 * offsets[docnum + 1]])
+
 class Index(object):
     """
     This class encapsulates the process of accessing the dictionary, as well as accessing
     the postings list and term frequencies on demand using address pointers stored in the dictionary. Upon initialization
     it marshalls the dictionary file into a dictionary object, and keeps a file pointer to the postings
-    file open.
+    file open. The forward index file is located relative to the dictionary file.
     """
 
     def __init__(self, index_filename, postings_filename):
@@ -50,6 +97,9 @@ class Index(object):
         """
         self._load_index(index_filename)
         self.total_docs = self.index["total_doc"]
+        self.docnums = {docid: n for n, docid in enumerate(self.index["docids"])}
+        self.tags = self.index.get("tags")
+        self.forward = ForwardIndex(os.path.join(os.path.dirname(os.path.abspath(index_filename)), self.index["forward"]))
         self.postings_filename = postings_filename
         self.postings_file = open(postings_filename, "rb")
 
@@ -81,10 +131,27 @@ class Index(object):
         returns a list of terms found in a particular docid
         """
         try:
-            term_ids = self.index["docs"]["rterms"][docid]
-            return map(self.index["lookup"].__getitem__, term_ids)
+            term_ids = self.forward.get(ForwardIndex.RAW_TERMS, self.docnums[docid])
         except KeyError as error:
             return []
+        else:
+            return map(self.index["lookup"].__getitem__, term_ids)
+
+    def doc_vector(self, docid):
+        """
+        returns the arrays of stemmed term ids and their term frequencies
+        of a particular docid, terms from document expansion excluded.
+        """
+        try:
+            docnum = self.docnums[docid]
+        except KeyError as error:
+            return array('I'), array('I')
+        else:
+            return self.forward.get(ForwardIndex.VECTOR_TERMS, docnum), self.forward.get(ForwardIndex.VECTOR_FREQS, docnum)
+
+    def stem(self, term_id):
+        """returns the stemmed term of a stemmed term id"""
+        return self.index["stems"][term_id]
 
     def doc_ipc(self, docid):
         """
@@ -95,6 +162,15 @@ class Index(object):
         except KeyError as error:
             return []
 
+    def ipc_docs(self, ipc):
+        """
+        returns the list of docids having a particular ipc label
+        """
+        try:
+            return self.index["ipc"][ipc]
+        except KeyError as error:
+            return []
+
     def docfreq(self, term):
         """
         returns the document frequency of a term.
@@ -145,24 +221,36 @@ class PatentSearch(object):
     _CANDIDATE_CUTOFF = 0.8 # cutoff based on % of top score
     _EXPANSION_LIMIT = 0.05 # limit query expansion to top % terms
 
-    def __init__(self, index_filename, postings_filename):
+    def __init__(self, index_filename, postings_filename, fast_tagger=False):
         """
         index_filename refers to the dictionary file.
         postings_filename refers to the postings file.
+        fast_tagger uses the suffix rules of the fast part of speech tagger instead of
+        nltk for terms whose tags were not precomputed in the index.
         """
         self.weights = {label: weights for label, weights in zip(self._DEFAULT_WEIGHT_LABELS, self._DEFAULT_WEIGHTS)}
         self.index = Index(index_filename, postings_filename)
+        self.fast_tagger = fast_tagger
+
+    def _query_weights(self, terms):
+        """
+        This method converts a list of query terms into a map of term to its tf.idf value
+        following the ltc scheme before cosine normalization, and returns it with the length
+        to normalize by.
+        """
+        counter = Counter(terms)
+        idf = lambda freq: freq > 0 and (log10(Fraction(self.index.total_docs, freq))) or 0
+        q_wts = {term: ((1 + log10(count)) * idf(self.index.docfreq(term))) for term, count in counter.iteritems()}
+        length = sum(map(lambda x: x**2, q_wts.values())) ** 0.5
+        return q_wts, length
 
     def _calculate_query_tfidf(self, terms):
         """
         This method converts a list of query terms into a vector representing its cosine normalized
         tf.idf values following the ltc scheme, and returns a map of term to tf.idf value.
         """
-        counter = Counter(terms)
-        idf = lambda freq: freq > 0 and (log10(Fraction(self.index.total_docs, freq))) or 0
-        q_wts = [((1 + log10(counter[term])) * idf(self.index.docfreq(term))) for term in counter.keys()]
-        length = sum(map(lambda x: x**2, q_wts)) ** 0.5
-        return length > 0 and {term: wts for term, wts in zip(terms, map(lambda x: x / length, q_wts))} or {}
+        q_wts, length = self._query_weights(terms)
+        return length > 0 and {term: wts / length for term, wts in q_wts.iteritems()} or {}
 
     def _retrieve_doc_tfidf(self, terms):
         """
@@ -172,26 +260,40 @@ class PatentSearch(object):
         evaluation.
         """
         doc_wts = defaultdict(lambda: {})
-        for term, postings in zip(terms, map(self.index.postings, set(terms))):
-            for docid, tfreq in postings:
+        for term in set(terms):
+            for docid, tfreq in self.index.postings(term):
                 doc_wts[docid][term] = float(tfreq)
         return doc_wts
 
-    def _calculate_similarity(self, query, docs, tagmap, weights=None):
-        """
-        This method calculates the similarity between a query and a document using their tf.idf values
-        according to the lnc.ltc scheme using cosine similarity.  
-        Results are returned in a dictionary of docid's mapped to scores.
-        If part of speech tagger is available, modify the similarity score for each term based
-        on its part of speech tag based on pretrained weights.
-        """
-        if weights is None:
-            weights = self.weights
-        results = defaultdict(lambda: 0)
-        for docid, doc_terms_weights in docs.items():
-            for term, weight in doc_terms_weights.items():
-                results[docid] += (query[term] * weight) * (tagmap and weights[tagmap[term]] or 1)
-        return results
+    def _tag_weight(self, term, tagmap, weights):
+        """returns the part of speech weight of a term, or 1 if there are no tags"""
+        return weights[tagmap.get(term, "OTHER")] if tagmap else 1
+
+    def _accumulate_scores(self, terms, tagmap, cache):
+        """
+        This method calculates the cosine similarity of the lnc.ltc scheme between the query and
+        every document containing its terms, with the contribution of every term weighted by its
+        part of speech tag if the tagger is available. Scores are computed incrementally
+        against a per query cache of postings, the contribution factor of every term and the
+        unnormalized score accumulator. Only terms that are new or whose factor changed since
+        the cache was last used have their postings read and their contribution added, so
+        repeating the query with added terms only reads the postings of those terms.
+        """
+        q_wts, length = self._query_weights(terms)
+        postings, factors, scores = cache["postings"], cache["factors"], cache["scores"]
+        for term in set(factors) | set(q_wts):
+            factor = q_wts.get(term, 0) * self._tag_weight(term, tagmap, self.weights)
+            delta = factor - factors.get(term, 0)
+            if delta == 0:
+                continue
+            if term not in postings:
+                postings[term] = [(docid, float(tfreq)) for docid, tfreq in self.index.postings(term)]
+            for docid, weight in postings[term]:
+                scores[docid] += delta * weight
+            factors[term] = factor
+        if length == 0:
+            return defaultdict(float)
+        return defaultdict(float, ((docid, score / length) for docid, score in scores.iteritems()))
 
     def _rank_results(self, results, similarities):
         """
@@ -200,56 +302,82 @@ class PatentSearch(object):
         """
         return sorted(results, key=lambda docid: (-similarities[docid], docid))
 
-    def _cull_results(self, similarities):
+    def _score_statistics(self, similarities):
         """
-        culls the results to remove documents that do not meet a cutoff mark.
+        returns the average and top similarity score, computed in a single
+        pass over the scores and shared by every cutoff applied to them.
         """
-        average = sum(similarities.values())/len(similarities)
-        return filter(lambda docid: similarities[docid] > (average / self._CULL_CUTOFF), similarities.keys())
+        if len(similarities) == 0:
+            return 0, 0
+        total, top = 0, None
+        for score in similarities.itervalues():
+            total += score
+            if top is None or score > top:
+                top = score
+        return total / len(similarities), top
 
-    def _get_candidates(self, results, similarities):
+    def _get_candidates(self, similarities, cull=True):
         """
-        retrieves candidates to be used for query expansion.
+        retrieves candidates to be used for query expansion, the documents scoring above
+        a fraction of the top score and unless cull is False, above the cull cutoff.
+        Candidates are selected by these cutoffs alone so the results are never sorted.
         """
-        top = similarities[results[0]] 
-        return filter(lambda docid: similarities[docid] > self._CANDIDATE_CUTOFF * top , results)
+        average, top = self._score_statistics(similarities)
+        cutoff = self._CANDIDATE_CUTOFF * top
+        if cull:
+            cutoff = max(cutoff, average / self._CULL_CUTOFF)
+        return [docid for docid, score in similarities.iteritems() if score > cutoff]
+
+    def _new_query_cache(self):
+        """returns an empty per query cache for _accumulate_scores"""
+        return {"postings": {}, "factors": {}, "scores": defaultdict(float)}
 
-    def _execute_query(self, terms, tagmap, modify=None, topk=True):
+    def _execute_query(self, terms, tagmap, modify=None, cache=None):
         """
         This method performs the search of the vector space model using the provided query. 
         Query tf.idf is calculated, and documents containing any of the query terms are retrieved
         and have their tf.idf calculated. Cosine similarity is used to calculated query to document
-        similarity, and then the results are ranked. If computing final results dont use topk.
+        similarity. Results are left unranked, returned as the map of docid to similarity.
+        A cache from a previous execution of the same query lets the scores be updated for the
+        added terms only.
         """
-        query_tfidfs = self._calculate_query_tfidf(terms)
-        doc_tfidfs = self._retrieve_doc_tfidf(terms)
-        similarities = self._calculate_similarity(query_tfidfs, doc_tfidfs, tagmap)
+        if cache is None:
+            cache = self._new_query_cache()
+        similarities = self._accumulate_scores(terms, tagmap, cache)
         # modify weights based on ipc labels
         if modify is not None:
             modify(similarities)
-        if topk: # dont cull final result
-            results = self._cull_results(similarities)
-        else:
-            results = similarities.keys()
-        results = self._rank_results(results, similarities)
-        return results, similarities
+        return similarities
 
     def _query_expansion(self, query_filename):
         """
         performs query expansion by performing a search with the original query first,
         followed by aggregating most common terms from the top results and using those
-        to augment the original query.
+        to augment the original query. Returns the query cache of the original search
+        along with the expanded query.
         """
         terms, tagmap = self._parse_query(query_filename)
-        preliminary_results, similarities = self._execute_query(terms, tagmap)
-        candidates = self._get_candidates(preliminary_results, similarities)
-        new_query = []
+        cache = self._new_query_cache()
+        similarities = self._execute_query(terms, tagmap, cache=cache)
+        candidates = self._get_candidates(similarities)
+        # sum the precomputed term frequency vectors of the candidates
+        new_term_counts = Counter()
         for candidate in candidates:
-            new_query.extend(self.index.doc_terms(candidate))
-        new_terms, new_tagmap = parsers.process_text(new_query, postag=True)
-        new_term_counts = Counter(new_terms)
+            term_ids, term_freqs = self.index.doc_vector(candidate)
+            new_term_counts.update(dict(itertools.izip(term_ids, term_freqs)))
+        if self.index.tags is not None: # tags were precomputed at index time
+            new_tagmap = {}
+            for term in itertools.imap(self.index.stem, new_term_counts):
+                if term in self.index.tags:
+                    new_tagmap[term] = self.index.tags[term]
+        else:
+            new_query = []
+            for candidate in candidates:
+                new_query.extend(self.index.doc_terms(candidate))
+            new_tagmap = parsers.pos_tags(new_query, fast=self.fast_tagger)
         # get new terms to add to query, but only for the top most common terms found
-        new_terms = sorted(set(new_terms), key=lambda term: -new_term_counts[term])[:int(len(new_term_counts)*self._EXPANSION_LIMIT)]
+        limit = int(len(new_term_counts)*self._EXPANSION_LIMIT)
+        new_terms = map(self.index.stem, heapq.nlargest(limit, new_term_counts, key=new_term_counts.__getitem__))
         old_terms = set(terms)
         for term in new_terms:
             if term not in old_terms:
@@ -257,19 +385,17 @@ class PatentSearch(object):
         for key in tagmap:
             if key not in new_tagmap:
                 new_tagmap[key] = tagmap[key]
-        return terms, new_tagmap
+        return terms, new_tagmap, cache
 
     def _determine_top_groups(self, similarities):
         """
         determines what is most likely the "correct" ipc labels for the query by 
         finding the most present ipc labels in the top results.
         """
-        results = sorted(similarities.keys(), key=lambda docid: (-similarities[docid], docid))
-        selected_results = self._get_candidates(results, similarities)
+        selected_results = self._get_candidates(similarities, cull=False)
         counter = Counter(itertools.chain(*[self.index.doc_ipc(docid) for docid in selected_results]))
-        ranked_groups = sorted(counter.keys(), key=counter.__getitem__, reverse=True)
-        top = counter[ranked_groups[0]]
-        selected_groups = set(filter(lambda ipc: counter[ipc] > top * 0.25, ranked_groups))
+        top = max(counter.itervalues()) if counter else 0
+        selected_groups = set(filter(lambda ipc: counter[ipc] > top * 0.25, counter))
         return selected_groups
 
     def _modify_similarity_score(self, similarities):
@@ -277,10 +403,13 @@ class PatentSearch(object):
         modifies the similarity score for a document if it belongs to the ipc
         group most likely associated with query. Not really useful unless we have
         cut off to increase precision at the cost of recall.
+        The documents to boost are the union of the top groups' ipc postings.
         """
-        top_groups = self._determine_top_groups(similarities)
-        for docid in similarities.keys():
-            if len(set(self.index.doc_ipc(docid)) & top_groups) > 0:
+        boosted = set()
+        for ipc in self._determine_top_groups(similarities):
+            boosted.update(self.index.ipc_docs(ipc))
+        for docid in boosted:
+            if docid in similarities:
                 similarities[docid] *= 1.5
 
     def _parse_query(self, query_filename):
@@ -293,16 +422,24 @@ class PatentSearch(object):
         file_root = file_tree.getroot()
         text = file_root[0].text + " " + file_root[1].text
         tokenized_text = parsers.tokenize_text(text)
-        terms, tagmap = parsers.process_text(tokenized_text, postag=True)
+        terms, tagmap = parsers.process_text(tokenized_text, postag=True, lexicon=self.index.tags, fast=self.fast_tagger)
         return terms, tagmap
 
+    def search(self, query_filename):
+        """
+        processes and executes the query in a query file, returning the
+        ranked list of docids and the map of docid to similarity.
+        """
+        terms, tagmap, cache = self._query_expansion(query_filename)
+        similarities = self._execute_query(terms, tagmap, modify=self._modify_similarity_score, cache=cache)
+        return self._rank_results(similarities.keys(), similarities), similarities
+
     def process_query(self, query_filename, output_filename):
         """
         public method that takes in a query file, processes and executes
         the query, then writes the result to the provided output filename.
         """
-        terms, tagmap = self._query_expansion(query_filename)
-        results, similarities = self._execute_query(terms, tagmap, modify=self._modify_similarity_score, topk=False)
+        results, similarities = self.search(query_filename)
         try:
             with open(output_filename, 'w') as output_file:
                 output_file.write(" ".join(results))
@@ -310,6 +447,77 @@ class PatentSearch(object):
             print "IO Error occured while attempting to run BooleanSearch"
             sys.exit(error.args[1])
 
+    def process_batch(self, query_filenames, output, trec=False, workers=None):
+        """
+        public method that executes a batch of query files. Worker processes are forked
+        from this instance so the index is loaded only once. Results are written to a file
+        named after each query in the output directory, or if trec is True, to the output
+        filename as a TREC run file.
+        """
+        global _batch_search
+        _batch_search = self
+        workers = workers or multiprocessing.cpu_count()
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, _init_batch_worker)
+            batch_results = pool.imap(_search_batch_query, query_filenames)
+        else:
+            pool = None
+            batch_results = itertools.imap(_search_batch_query, query_filenames)
+        try:
+            if trec:
+                with open(output, 'w') as output_file:
+                    for query_filename, results in batch_results:
+                        query_id = _query_id(query_filename)
+                        for rank, (docid, score) in enumerate(results, 1):
+                            output_file.write("%s Q0 %s %d %.6f PatentSearch\n" % (query_id, docid, rank, score))
+            else:
+                if not os.path.isdir(output):
+                    os.makedirs(output)
+                for query_filename, results in batch_results:
+                    with open(os.path.join(output, _query_id(query_filename) + ".txt"), 'w') as output_file:
+                        output_file.write(" ".join(docid for docid, score in results))
+        except IOError as error:
+            print "IO Error occured while attempting to run PatentSearch"
+            sys.exit(error.args[1])
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+# PatentSearch instance shared with the batch worker processes when they are forked
+_batch_search = None
+
+def _init_batch_worker():
+    """
+    reopens the postings file in a batch worker, as the forked processes would
+    otherwise share and move the same file offset.
+    """
+    _batch_search.index._reopen_postings_file()
+
+def _search_batch_query(query_filename):
+    """
+    searches a single query file of a batch, returning the ranked list of
+    docids and their scores as plain tuples that can be sent back from a worker.
+    """
+    results, similarities = _batch_search.search(query_filename)
+    return query_filename, [(docid, similarities[docid]) for docid in results]
+
+def _query_id(query_filename):
+    """the id of a query is its file name without the extension"""
+    return os.path.splitext(os.path.basename(query_filename))[0]
+
+def read_query_filenames(path):
+    """
+    returns the query files of a batch, the xml files in a directory
+    or the files listed in a manifest file.
+    """
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".xml")]
+    with open(path, 'r') as manifest_file:
+        names = [line.strip() for line in manifest_file if line.strip()]
+    manifest_file.close()
+    return [os.path.join(os.path.dirname(os.path.abspath(path)), name) for name in names]
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
@@ -317,10 +525,20 @@ if __name__ == "__main__":
     # mandatory arguments
     parser.add_argument("-d", required=True, help="dictionary-file", metavar="dict", dest="dict")
     parser.add_argument("-p", required=True, help="postings-file", metavar="postings", dest="postings")
-    parser.add_argument("-q", required=True, help="file-of-queries", metavar="queries", dest="queries")
     parser.add_argument("-o", required=True, help="output-file-of-results", metavar="output", dest="output")
+    queries = parser.add_mutually_exclusive_group(required=True)
+    queries.add_argument("-q", help="file-of-queries", metavar="queries", dest="queries")
+    queries.add_argument("-b", help="directory-or-manifest-of-query-files", metavar="batch", dest="batch")
+
+    # optional arguments
+    parser.add_argument("-t", action="store_true", help="tag terms missing from the index lexicon by suffix instead of with nltk", dest="fast_tagger")
+    parser.add_argument("-r", action="store_true", help="write batch results as a TREC run file", dest="trec")
+    parser.add_argument("-w", type=int, help="number of batch worker processes", metavar="workers", dest="workers")
 
     args = parser.parse_args()
 
-    ps = PatentSearch(args.dict, args.postings)
-    ps.process_query(args.queries, args.output)
\ No newline at end of file
+    ps = PatentSearch(args.dict, args.postings, args.fast_tagger)
+    if args.batch is not None:
+        ps.process_batch(read_query_filenames(args.batch), args.output, args.trec, args.workers)
+    else:
+        ps.process_query(args.queries, args.output)
\ No newline at end of file
@@ -0,0 +1,75 @@
+#!/usr/bin/env python2.7
+
+"""
+Matric: A0112937E
+Email:  a0112937@u.nus.edu
+
+Tests of the batch mode of PatentSearch, run against an index built by index.py over the
+synthetic patent corpus of benchmark.py.
+
+usage is as follows:
+
+$ python test_search.py
+
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+HW4_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HW4_DIR)
+sys.path.insert(0, os.path.dirname(HW4_DIR))
+
+import search
+import benchmark
+
+class BatchSearchTest(unittest.TestCase):
+    """
+    Builds a small index once, and checks that a batch searched by worker processes
+    gives the same results as the batch searched in this process.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp()
+        generator = benchmark.CorpusGenerator(60, 5, 6, 0)
+        generator.write_patent_corpus(os.path.join(cls.work_dir, "corpus"))
+        generator.write_ipc(os.path.join(cls.work_dir, "IPC.txt"))
+        cls.queries = generator.write_patent_queries(os.path.join(cls.work_dir, "queries"))
+        cls.dict_filename, cls.postings_filename, build_time = benchmark.build_index("hw4", os.path.join(cls.work_dir, "corpus"), cls.work_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir)
+
+    def _run_batch(self, output, trec, workers):
+        """searches the queries as a batch and returns the output filename"""
+        ps = search.PatentSearch(self.dict_filename, self.postings_filename)
+        output = os.path.join(self.work_dir, output)
+        ps.process_batch(self.queries, output, trec, workers)
+        return output
+
+    def _read(self, filename):
+        with open(filename, 'r') as output_file:
+            return output_file.read()
+
+    def test_trec_batch_with_workers(self):
+        """a TREC run file written by 2 workers matches the one written by 1"""
+        single = self._read(self._run_batch("single.trec", True, 1))
+        pooled = self._read(self._run_batch("pooled.trec", True, 2))
+        self.assertTrue(single)
+        self.assertEqual(single, pooled)
+
+    def test_directory_batch_with_workers(self):
+        """the result files written by 2 workers match the ones written by 1"""
+        single = self._run_batch("single", False, 1)
+        pooled = self._run_batch("pooled", False, 2)
+        self.assertEqual(len(os.listdir(pooled)), len(self.queries))
+        self.assertEqual(sorted(os.listdir(single)), sorted(os.listdir(pooled)))
+        for name in os.listdir(single):
+            self.assertEqual(self._read(os.path.join(single, name)), self._read(os.path.join(pooled, name)))
+
+if __name__ == "__main__":
+    unittest.main()